@@ -1,17 +1,20 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, jsonify, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, jsonify, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
-from models import User, Test, Question, History
+from models import User, Test, Question, History, CardState, QuestionStats
 from forms import UserForm, TestForm, QuestionForm, ImportForm, PasswordForm
-from extensions import db
-from utils import allowed_file, allowed_import_file, create_test_zip, extract_test_zip, save_extracted_images
-import os
+from extensions import db, image_processor
+from utils import allowed_file, allowed_import_file, question_counts, normalize_image_path
+from image_store import save_upload, release_images
+from grading import invalidate_answer_key
+from importer import import_tests, import_zip, iter_json_tests
+from exporter import stream_tests_zip, export_revision, export_cache
+from item_stats import item_analysis as build_item_analysis, backfill_item_stats, rescore_attempts
 import json
 import re
+from urllib.parse import quote
 from io import BytesIO
 import sqlite3
-from PIL import Image
 import logging
 
 # Set up logging
@@ -20,22 +23,10 @@ logger = logging.getLogger(__name__)
 
 admin_bp = Blueprint('admin', __name__)
 
-def normalize_image_path(image_path):
-    """Normalize image path by removing 'uploads/' prefix if present."""
-    if image_path and image_path.startswith('uploads/'):
-        return os.path.basename(image_path)
-    return image_path
-
-def compress_image(file_path):
-    """Compress image to reduce file size while maintaining quality."""
-    try:
-        img = Image.open(file_path)
-        img.thumbnail((800, 600))
-        img.save(file_path, optimize=True, quality=85)
-        logger.debug(f"Compressed image: {file_path}")
-    except Exception as e:
-        logger.error(f"Error compressing image {file_path}: {str(e)}")
-        raise
+def mark_test_changed(test_id):
+    """Bump a test's revision so cached answer keys and rendered pages are rebuilt."""
+    Test.query.filter_by(id=test_id).update({Test.revision: Test.revision + 1})
+    invalidate_answer_key(test_id)
 
 @admin_bp.route('/dashboard', methods=['GET', 'POST'])
 @login_required
@@ -82,100 +73,38 @@ def tests():
             # Handle ZIP files
             if filename.endswith('.zip'):
                 logger.debug(f'Processing ZIP file: {filename}')
-                try:
-                    # Extract data and images from ZIP
-                    data, extracted_images = extract_test_zip(file)
-                    
-                    # Save extracted images
-                    saved_images = save_extracted_images(extracted_images)
-                    logger.debug(f'Saved {len(saved_images)} images from ZIP')
-                    
-                except Exception as e:
-                    flash(f'Error processing ZIP file: {str(e)}', 'danger')
-                    logger.error(f'ZIP processing error: {str(e)}')
-                    return render_template('admin/dashboard.html', tests=tests, import_form=import_form)
-            
-            # Handle JSON files (original logic)
+                result = import_zip(file.stream, overwrite=import_form.overwrite.data,
+                                    sync=import_form.sync.data, retire=import_form.retire.data)
+                logger.debug(f'Saved {result.images} images from ZIP')
+
+            # Handle JSON files
             elif filename.endswith('.json'):
                 logger.debug(f'Processing JSON file: {filename}')
-                data = json.load(file)
-            
+                result = import_tests(iter_json_tests(file.stream), overwrite=import_form.overwrite.data,
+                                      sync=import_form.sync.data, retire=import_form.retire.data)
+
             else:
                 flash('Invalid file type. Please upload a JSON or ZIP file.', 'danger')
-                return render_template('admin/dashboard.html', tests=tests, import_form=import_form)
-            
-            total_tests = len(data)
-            total_questions = sum(len(test_data.get('questions', [])) for test_data in data)
-            logger.debug(f'Importing {total_tests} tests with {total_questions} questions')
-            if import_form.overwrite.data:
-                Test.query.delete()
-                Question.query.delete()
-                db.session.commit()
-                try:
-                    conn = sqlite3.connect(current_app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', ''))
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='sqlite_sequence'")
-                    if cursor.fetchone():
-                        cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('test', 'question')")
-                        conn.commit()
-                    conn.close()
-                    logger.debug("Reset SQLite sequence for tests and questions")
-                except sqlite3.OperationalError as e:
-                    flash(f'Warning: Could not reset sequence: {str(e)}', 'warning')
-                    logger.warning(f'Could not reset sequence: {str(e)}')
-            imported_questions = 0
-            for test_data in data:
-                if not isinstance(test_data, dict) or 'test_name' not in test_data:
-                    logger.warning(f'Skipping invalid test data: {test_data}')
-                    continue
-                test_args = {
-                    'name': test_data['test_name'],
-                    'description': test_data.get('description', '')
-                }
-                if hasattr(Test, 'num_questions'):
-                    test_args['num_questions'] = len(test_data.get('questions', []))
-                test = Test(**test_args)
-                db.session.add(test)
-                db.session.commit()
-                for q in test_data.get('questions', []):
-                    if not isinstance(q, dict) or 'type' not in q or 'text' not in q:
-                        logger.warning(f'Skipping invalid question data: {q}')
-                        continue
-                    image_path = normalize_image_path(q.get('image'))
-                    if q['type'] == 'match':
-                        if not (q.get('terms') and q.get('definitions') and q.get('correct_mappings')):
-                            logger.warning(f'Skipping match question due to missing terms/definitions/mappings: {q}')
-                            continue
-                        options = json.dumps({
-                            'terms': q.get('terms', []),
-                            'definitions': q.get('definitions', [])
-                        })
-                        correct = json.dumps(q.get('correct_mappings', {}))
-                    else:
-                        options = json.dumps(q.get('options', []))
-                        correct = q.get('correct', '')
-                    question = Question(
-                        test_id=test.id,
-                        type=q['type'],
-                        text=q['text'],
-                        options=options,
-                        correct=correct,
-                        explanation=q.get('explanation', ''),
-                        image=image_path
-                    )
-                    db.session.add(question)
-                    imported_questions += 1
-                db.session.commit()
-            logger.debug(f'Imported {imported_questions} questions out of {total_questions}')
-            if imported_questions < total_questions:
-                flash(f'Imported {imported_questions} out of {total_questions} questions. Check logs for skipped questions.', 'warning')
+                return render_template('admin/dashboard.html', tests=tests, import_form=import_form, question_counts=question_counts())
+
+            summary = (f'Imported {result.tests} tests with {result.questions} questions in {result.elapsed:.1f}s '
+                       f'({result.questions / result.elapsed if result.elapsed else 0:.0f} questions/s)')
+            if import_form.sync.data:
+                summary += f'; {result.updated} updated, {result.unchanged} unchanged, {result.retired} removed'
+            if result.skipped:
+                flash(f'{summary}; skipped {len(result.skipped)} invalid entries. Check logs for details.', 'warning')
             else:
-                flash('Tests imported from JSON.', 'success')
+                flash(summary + '.', 'success')
+            if result.image_errors:
+                failed = ', '.join(f'{name} ({error})' for name, error in list(result.image_errors.items())[:5])
+                more = f' and {len(result.image_errors) - 5} more' if len(result.image_errors) > 5 else ''
+                flash(f'{len(result.image_errors)} images had problems: {failed}{more}.', 'warning')
+            tests = Test.query.all()
         except Exception as e:
             db.session.rollback()
             flash(f'Import error: {str(e)}', 'danger')
             logger.error(f'Import error: {str(e)}')
-    return render_template('admin/dashboard.html', tests=tests, import_form=import_form)
+    return render_template('admin/dashboard.html', tests=tests, import_form=import_form, question_counts=question_counts())
 
 @admin_bp.route('/edit_user/<int:user_id>', methods=['POST'])
 @login_required
@@ -228,55 +157,7 @@ def export_tests():
     if not current_user.is_admin:
         return redirect(url_for('user.dashboard'))
     
-    tests = Test.query.all()
-    data = []
-    total_questions = 0
-    images_data = {}
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    
-    for test in tests:
-        questions = []
-        for q in test.questions:
-            question_data = {
-                'id': q.id,
-                'type': q.type,
-                'text': q.text,
-                'explanation': q.explanation,
-                'image': q.image
-            }
-            try:
-                if q.type == 'match':
-                    options = json.loads(q.options or '{}')
-                    question_data['terms'] = options.get('terms', [])
-                    question_data['definitions'] = options.get('definitions', [])
-                    question_data['correct_mappings'] = json.loads(q.correct or '{}')
-                else:
-                    question_data['options'] = json.loads(q.options or '[]')
-                    question_data['correct'] = q.correct
-                
-                # Collect image files for ZIP
-                if q.image:
-                    image_path = os.path.join(upload_folder, q.image)
-                    if os.path.exists(image_path):
-                        images_data[q.image] = image_path
-                
-                questions.append(question_data)
-                total_questions += 1
-            except json.JSONDecodeError as e:
-                logger.warning(f'Skipping question ID {q.id} due to invalid JSON: {str(e)}')
-                continue
-        data.append({
-            'test_name': test.name,
-            'description': test.description,
-            'questions': questions
-        })
-    
-    logger.debug(f'Exported {len(tests)} tests with {total_questions} questions and {len(images_data)} images')
-    
-    # Create ZIP archive
-    zip_output = create_test_zip(data, images_data)
-    
-    return send_file(zip_output, as_attachment=True, download_name='tests_export.zip', mimetype='application/zip')
+    return _zip_response(None, 'tests_export.zip')
 
 @admin_bp.route('/export_test/<int:test_id>')
 @login_required
@@ -286,55 +167,42 @@ def export_test(test_id):
         return redirect(url_for('user.dashboard'))
     
     test = Test.query.get_or_404(test_id)
-    questions = []
-    images_data = {}
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    
-    for q in test.questions:
-        question_data = {
-            'id': q.id,
-            'type': q.type,
-            'text': q.text,
-            'explanation': q.explanation,
-            'image': q.image
-        }
-        try:
-            if q.type == 'match':
-                options = json.loads(q.options or '{}')
-                question_data['terms'] = options.get('terms', [])
-                question_data['definitions'] = options.get('definitions', [])
-                question_data['correct_mappings'] = json.loads(q.correct or '{}')
-            else:
-                question_data['options'] = json.loads(q.options or '[]')
-                question_data['correct'] = q.correct
-            
-            # Collect image files for ZIP
-            if q.image:
-                image_path = os.path.join(upload_folder, q.image)
-                if os.path.exists(image_path):
-                    images_data[q.image] = image_path
-            
-            questions.append(question_data)
-        except json.JSONDecodeError as e:
-            logger.warning(f'Skipping question ID {q.id} due to invalid JSON: {str(e)}')
-            continue
-    
-    data = [{
-        'test_name': test.name,
-        'description': test.description,
-        'questions': questions
-    }]
-    
-    logger.debug(f'Exported test "{test.name}" with {len(questions)} questions and {len(images_data)} images')
     
     # Create safe filename from test name
     safe_filename = re.sub(r'[^\w\-_\.]', '_', test.name.lower())
-    filename = f'{safe_filename}_export.zip'
-    
-    # Create ZIP archive
-    zip_output = create_test_zip(data, images_data)
-    
-    return send_file(zip_output, as_attachment=True, download_name=filename, mimetype='application/zip')
+    return _zip_response([test.id], f'{safe_filename}_export.zip')
+
+def _zip_response(test_ids, filename):
+    """Serve an export from the cache, or stream it while caching it (test_ids None exports every test).
+
+    Cached archives are sent with ETag and Last-Modified and answer
+    conditional and range requests, so an unchanged export costs a stat().
+    """
+    test_ids, revision = export_revision(test_ids)
+    if revision in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(revision)
+        return response
+    cache = export_cache()
+    path = cache.get(revision)
+    if path:
+        logger.debug(f'Serving cached export {revision}')
+        response = send_file(path, mimetype='application/zip', as_attachment=True, download_name=filename,
+                             etag=revision, conditional=True)
+    else:
+        response = Response(stream_with_context(cache.write_through(revision, stream_tests_zip(test_ids))),
+                            mimetype='application/zip')
+        response.set_etag(revision)
+        try:
+            filename.encode('ascii')
+            response.headers.set('Content-Disposition', 'attachment', filename=filename)
+        except UnicodeEncodeError:
+            # Same RFC 2231 form send_file uses for non-ASCII test names
+            response.headers.set('Content-Disposition', 'attachment', filename=filename.encode('ascii', 'ignore').decode(),
+                                 **{'filename*': f"UTF-8''{quote(filename)}"})
+    # Backups of the whole bank: keep them out of shared caches and revalidate every time
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @admin_bp.route('/create_test', methods=['GET', 'POST'])
 @login_required
@@ -406,6 +274,7 @@ def edit_test(test_id):
         if hasattr(Test, 'num_questions'):
             test.num_questions = form.num_questions.data
         try:
+            mark_test_changed(test.id)
             db.session.commit()
             flash('Test updated successfully.', 'success')
             logger.info(f"Updated test ID {test_id}")
@@ -418,12 +287,7 @@ def edit_test(test_id):
         file = q_form.image.data
         image_path = None
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            file.save(full_path)
-            compress_image(full_path)
-            image_path = filename
+            image_path = save_upload(file)
         if q_form.type.data == 'match':
             try:
                 terms = json.loads(q_form.options.data).get('terms', []) if q_form.options.data else []
@@ -459,7 +323,9 @@ def edit_test(test_id):
         )
         db.session.add(question)
         try:
+            mark_test_changed(test.id)
             db.session.commit()
+            image_processor.submit([image_path])
             flash('Question added successfully.', 'success')
             logger.info(f"Added question to test ID {test_id}")
         except Exception as e:
@@ -587,26 +453,13 @@ def edit_question(question_id):
         file = form.image.data
         image_path = question.image
         
-        # Handle image deletion
+        # Handle image deletion; the file goes once no other question uses it
         if form.delete_image.data and question.image:
-            full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], question.image)
-            if os.path.exists(full_path):
-                try:
-                    os.remove(full_path)
-                    logger.debug(f"Deleted image: {full_path}")
-                    image_path = None
-                except Exception as e:
-                    flash(f'Error deleting image: {str(e)}', 'danger')
-                    logger.error(f'Error deleting image {full_path}: {str(e)}')
+            image_path = None
         
         # Handle new image upload
         if file and isinstance(file, FileStorage) and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            file.save(full_path)
-            compress_image(full_path)
-            image_path = filename
+            image_path = save_upload(file)
         
         # Process form data based on question type
         if form.type.data == 'match':
@@ -694,11 +547,16 @@ def edit_question(question_id):
         question.options = options
         question.correct = correct
         question.explanation = form.explanation.data
+        previous_image = question.image
         question.image = image_path
         
         # Save to database
         try:
+            mark_test_changed(question.test_id)
             db.session.commit()
+            if previous_image != image_path:
+                image_processor.submit([image_path])
+                release_images([previous_image])
             flash('Question updated successfully.', 'success')
             logger.info(f"Updated question ID {question_id}: type={form.type.data}, correct={correct}")
             
@@ -743,22 +601,19 @@ def instructions():
 @admin_bp.route('/delete_question/<int:question_id>', methods=['POST'])
 @login_required
 def delete_question(question_id):
-    """Delete a question and its associated image."""
+    """Delete a question and its image, unless another question uses it."""
     if not current_user.is_admin:
         return redirect(url_for('user.dashboard'))
     question = Question.query.get_or_404(question_id)
     test_id = question.test_id
-    if question.image:
-        full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], question.image)
-        if os.path.exists(full_path):
-            try:
-                os.remove(full_path)
-                logger.debug(f"Deleted image: {full_path}")
-            except Exception as e:
-                logger.error(f'Error deleting image {full_path}: {str(e)}')
+    image = question.image
+    CardState.query.filter_by(question_id=question_id).delete()
+    QuestionStats.query.filter_by(question_id=question_id).delete()
     db.session.delete(question)
     try:
+        mark_test_changed(test_id)
         db.session.commit()
+        release_images([image])
         flash('Question deleted successfully.', 'success')
         logger.info(f"Deleted question ID {question_id}")
     except Exception as e:
@@ -774,18 +629,14 @@ def delete_test(test_id):
     if not current_user.is_admin:
         return redirect(url_for('user.dashboard'))
     test = Test.query.get_or_404(test_id)
-    for question in test.questions:
-        if question.image:
-            full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], question.image)
-            if os.path.exists(full_path):
-                try:
-                    os.remove(full_path)
-                    logger.debug(f"Deleted image: {full_path}")
-                except Exception as e:
-                    logger.error(f'Error deleting image {full_path}: {str(e)}')
+    images = [question.image for question in test.questions]
+    CardState.query.filter_by(test_id=test_id).delete()
+    QuestionStats.query.filter_by(test_id=test_id).delete()
     db.session.delete(test)
     try:
         db.session.commit()
+        release_images(images)
+        invalidate_answer_key(test_id)
         if not Test.query.first():
             try:
                 conn = sqlite3.connect(current_app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', ''))
@@ -805,4 +656,45 @@ def delete_test(test_id):
         db.session.rollback()
         flash(f'Error deleting test: {str(e)}', 'danger')
         logger.error(f'Error deleting test ID {test_id}: {str(e)}')
-    return redirect(url_for('admin.tests'))
\ No newline at end of file
+    return redirect(url_for('admin.tests'))
+
+@admin_bp.route('/rescore_test/<int:test_id>', methods=['POST'])
+@login_required
+def rescore_test(test_id):
+    """Re-grade all stored attempts for a test against its current answer key."""
+    if not current_user.is_admin:
+        return redirect(url_for('user.dashboard'))
+    test = Test.query.get_or_404(test_id)
+    try:
+        scanned, updated = rescore_attempts(test.id)
+        flash(f'Re-scored {scanned} attempts for "{test.name}" ({updated} scores changed).', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error re-scoring test: {str(e)}', 'danger')
+        logger.error(f'Error re-scoring test ID {test_id}: {str(e)}')
+    return redirect(url_for('admin.tests'))
+
+@admin_bp.route('/item_analysis/<int:test_id>')
+@login_required
+def item_analysis(test_id):
+    """Per-question difficulty (p-value) and discrimination from the item statistics table."""
+    if not current_user.is_admin:
+        return redirect(url_for('user.dashboard'))
+    test = Test.query.get_or_404(test_id)
+    return render_template('admin/item_analysis.html', test=test, items=build_item_analysis(test.id))
+
+@admin_bp.route('/item_analysis/<int:test_id>/backfill', methods=['POST'])
+@login_required
+def backfill_test_stats(test_id):
+    """Rebuild a test's item statistics from stored history."""
+    if not current_user.is_admin:
+        return redirect(url_for('user.dashboard'))
+    test = Test.query.get_or_404(test_id)
+    try:
+        scanned, questions = backfill_item_stats(test.id)
+        flash(f'Rebuilt statistics for {questions} questions from {scanned} attempts.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error rebuilding statistics: {str(e)}', 'danger')
+        logger.error(f'Error backfilling item statistics for test ID {test_id}: {str(e)}')
+    return redirect(url_for('admin.item_analysis', test_id=test.id))
@@ -1,19 +1,27 @@
 import os
-from flask import Flask, send_from_directory
+from flask import Flask, request
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from config import Config
-from extensions import db
+from extensions import db, history_writer, image_processor
+from database import init_sqlite
+from grading import init_answer_key_cache
 from auth import auth_bp
 from admin import admin_bp
 from user import user_bp
 from utils import allowed_file
+from image_store import send_image
+from commands import register_commands, bootstrap
 import json
 
 app = Flask(__name__)
 app.config.from_object(Config)
 db.init_app(app)
-migrate = Migrate(app, db)
+init_sqlite(app)
+init_answer_key_cache(app)
+history_writer.init_app(app)
+image_processor.init_app(app)
+migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -61,16 +69,19 @@ def get_full_answer(correct_letter, options_json):
     except (json.JSONDecodeError, AttributeError, TypeError):
         return correct_letter
 
-# Serve uploaded images
+# Serve uploaded images, or a generated variant of one (?variant=display|preview|webp) once it exists
 @app.route('/uploads/<filename>')
 def serve_image(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return send_image(filename, request.args.get('variant'))
 
 # Register Blueprints
 app.register_blueprint(auth_bp)
 app.register_blueprint(admin_bp, url_prefix='/admin')
 app.register_blueprint(user_bp, url_prefix='/user')
 
+# Register CLI commands
+register_commands(app)
+
 # Health check endpoint for Docker
 @app.route('/health')
 def health():
@@ -79,36 +90,7 @@ def health():
 # Import models at the end to avoid circular imports
 from models import User, Test, Question, History
 
-# Create upload folder and initialize admin user
-with app.app_context():
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    db.create_all()
-    
-    # Create or update admin user from environment variable
-    admin_password = os.getenv('ADMIN_PASSWORD', 'admin')
-    admin_user = User.query.filter_by(username='admin').first()
-    
-    if admin_user:
-        # Update existing admin user password
-        admin_user.set_password(admin_password)
-        admin_user.is_admin = True
-        admin_user.role = 'admin'
-    else:
-        # Create new admin user
-        admin_user = User(
-            username='admin',
-            role='admin',
-            is_admin=True
-        )
-        admin_user.set_password(admin_password)
-        db.session.add(admin_user)
-    
-    try:
-        db.session.commit()
-        print(f"✅ Admin user configured with password from environment")
-    except Exception as e:
-        db.session.rollback()
-        print(f"❌ Error configuring admin user: {e}")
-
 if __name__ == '__main__':
+    with app.app_context():
+        bootstrap()
     app.run(debug=True, host='0.0.0.0', port=3000)
\ No newline at end of file
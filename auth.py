@@ -6,6 +6,10 @@ from forms import LoginForm
 
 auth_bp = Blueprint('auth', __name__)
 
+def user_by_name_query(username):
+    """Query for the user logging in under a name."""
+    return User.query.filter_by(username=username)
+
 @auth_bp.route('/')
 def index():
     if current_user.is_authenticated:
@@ -19,7 +23,7 @@ def index():
 def login():
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(username=form.username.data).first()
+        user = user_by_name_query(form.username.data).first()
         if user and user.check_password(form.password.data):
             login_user(user)
             flash('Logged in successfully!', 'success')
@@ -0,0 +1,107 @@
+from abc import ABC, abstractmethod
+import atexit
+import os
+import queue
+import threading
+import time
+
+_STOP = object()
+
+class BackgroundWorker(ABC):
+    """Base for extensions that hand work to a background thread.
+
+    Items passed to _put() are queued for a daemon thread started lazily and
+    per process, so forked workers get their own thread. The thread takes
+    items in batches of up to max_items, waiting up to wait seconds after
+    the first one for more (0: only what is already queued), and passes
+    each batch to _handle(). shutdown() runs at interpreter exit; items
+    still queued are handled first when drain_on_shutdown is set and
+    dropped otherwise.
+    """
+
+    thread_name = 'background-worker'
+    drain_on_shutdown = True
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        atexit.register(self.shutdown)
+
+    def _batch_limits(self):
+        """Return (max_items, wait) for batches; read from app config by subclasses."""
+        return 1, 0
+
+    def _queue_size(self):
+        """Maximum number of queued items, 0 for no limit."""
+        return 0
+
+    @abstractmethod
+    def _handle(self, batch):
+        """Process one batch of queued items on the background thread."""
+
+    def _put(self, item, timeout=None):
+        """Queue an item for the background thread; raises queue.Full after timeout on a full queue."""
+        self._ensure_worker()
+        self._queue.put(item, timeout=timeout)
+
+    def _ensure_worker(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._queue = queue.Queue(maxsize=self._queue_size())
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        max_items, wait = self._batch_limits()
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + wait
+            while len(batch) < max_items:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._handle(batch)
+        if self.drain_on_shutdown:
+            leftover = [item for item in self._drain() if item is not _STOP]
+            if leftover:
+                self._handle(leftover)
+
+    def _drain(self):
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def shutdown(self):
+        """Stop the background thread once the batch in progress (and, with drain_on_shutdown, the queue) is handled."""
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            if not self.drain_on_shutdown:
+                self._drain()
+            self._queue.put(_STOP)
+            thread.join()
+        self._thread = None
@@ -0,0 +1,143 @@
+from collections import OrderedDict
+import os
+import tempfile
+import threading
+import time
+
+
+class LRUCache:
+    """Small thread-safe LRU cache.
+
+    Bounded by entry count, and optionally by total weight (e.g. bytes of
+    rendered HTML) when maxweight and a weigher function are given.
+    """
+
+    def __init__(self, maxsize=128, maxweight=None, weigher=len):
+        self.maxsize = maxsize
+        self.maxweight = maxweight
+        self._weigher = weigher
+        self._weight = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _weigh(self, value):
+        return self._weigher(value) if self.maxweight is not None else 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            if key in self._data:
+                self._weight -= self._weigh(self._data.pop(key))
+            self._data[key] = value
+            self._weight += self._weigh(value)
+            while self._data and (len(self._data) > self.maxsize or
+                                  (self.maxweight is not None and self._weight > self.maxweight)):
+                _, evicted = self._data.popitem(last=False)
+                self._weight -= self._weigh(evicted)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data.pop(key)
+            self._weight -= self._weigh(value)
+            return value
+
+    def discard_where(self, predicate):
+        """Drop every entry whose key matches predicate(key)."""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                self._weight -= self._weigh(self._data.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._weight = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FileCache:
+    """Directory of cached files shared by every worker process, evicted LRU by total size.
+
+    Recency is tracked in each file's access time, which is set explicitly on
+    every hit (so noatime mounts still work) and leaves the modification time
+    free to act as Last-Modified. Files are written to a temporary name and
+    renamed into place, so readers never see a partial file.
+    """
+
+    def __init__(self, directory, maxbytes, suffix=''):
+        self.directory = directory
+        self.maxbytes = maxbytes
+        self.suffix = suffix
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}{self.suffix}')
+
+    def get(self, key):
+        """Path of the cached file for key, marked as recently used, or None."""
+        path = self.path(key)
+        try:
+            stat = os.stat(path)
+            os.utime(path, (time.time(), stat.st_mtime))
+        except FileNotFoundError:
+            return None
+        return path
+
+    def write_through(self, key, chunks):
+        """Yield chunks unchanged while saving them; the file is cached only if every chunk arrives."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in chunks:
+                    tmp.write(chunk)
+                    yield chunk
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            # Includes GeneratorExit when the client disconnects mid-download
+            os.unlink(tmp_path)
+            raise
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Delete least recently used files until the directory fits in maxbytes."""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.startswith('.tmp-'):
+                    # Left behind by a worker killed mid-write
+                    if stat.st_mtime < time.time() - 24 * 3600:
+                        try:
+                            os.unlink(entry.path)
+                        except FileNotFoundError:
+                            pass
+                    continue
+                if not entry.name.endswith(self.suffix):
+                    continue
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+                total += stat.st_size
+        keep_path = self.path(keep) if keep is not None else None
+        for _, size, path in sorted(entries):
+            if total <= self.maxbytes:
+                break
+            if path == keep_path:
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
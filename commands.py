@@ -0,0 +1,204 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from extensions import db, image_processor
+from models import User, Test, ImageBlob
+from query_plans import find_full_scans
+from item_stats import backfill_item_stats, rescore_attempts
+from importer import import_tests, import_zip, iter_json_tests
+from image_store import dedupe_images
+import os
+import time
+
+def ensure_admin_user(password):
+    """Create the admin user, or make sure it is an admin with the given password.
+
+    The password is only re-hashed when the stored hash does not already match,
+    so repeated bootstraps are a read plus one hash check.
+
+    Returns:
+        bool: True if anything was written
+    """
+    admin_user = User.query.filter_by(username='admin').first()
+    if admin_user is None:
+        admin_user = User(username='admin', role='admin', is_admin=True)
+        admin_user.set_password(password)
+        db.session.add(admin_user)
+    else:
+        if not admin_user.password_hash or not admin_user.check_password(password):
+            admin_user.set_password(password)
+        admin_user.is_admin = True
+        admin_user.role = 'admin'
+    if admin_user in db.session.new or db.session.is_modified(admin_user):
+        db.session.commit()
+        return True
+    return False
+
+# First migration: the schema databases created before migrations were tracked already have
+_INITIAL_REVISION = '126c771f4f07'
+
+def migrate_schema():
+    """Bring the database schema up to date.
+
+    An empty database gets the current schema from the models and is
+    stamped at the latest migration; one created by db.create_all() before
+    migrations were tracked is stamped at the initial schema first. Every
+    other database only runs its pending migrations.
+    """
+    from flask_migrate import upgrade, stamp
+    tables = set(db.inspect(db.engine).get_table_names())
+    if not tables - {'alembic_version'}:
+        db.create_all()
+        stamp()
+        return
+    if 'alembic_version' not in tables:
+        stamp(revision=_INITIAL_REVISION)
+    upgrade()
+
+def bootstrap():
+    """Create folders, bring the schema up to date and configure the admin user.
+
+    Idempotent; run once per deploy (flask bootstrap) rather than in every worker.
+    """
+    from database import sqlite_profile
+    os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
+    migrate_schema()
+    print('🗄️ Database profile: ' + ', '.join(f'{name}={value}' for name, value in sqlite_profile().items()))
+    try:
+        if ensure_admin_user(os.getenv('ADMIN_PASSWORD', 'admin')):
+            print("✅ Admin user configured with password from environment")
+        else:
+            print("✅ Admin user already up to date")
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Error configuring admin user: {e}")
+
+@click.command('bootstrap')
+@with_appcontext
+def bootstrap_command():
+    """Create tables, run migrations and configure the admin user."""
+    bootstrap()
+
+def _resolve_test_ids(test_id, all_tests):
+    if all_tests:
+        return [row[0] for row in db.session.query(Test.id).order_by(Test.id).all()]
+    if test_id is not None:
+        if db.session.get(Test, test_id) is None:
+            raise click.ClickException(f'Test ID {test_id} not found.')
+        return [test_id]
+    raise click.UsageError('Pass a TEST_ID or --all.')
+
+@click.command('rescore-history')
+@click.argument('test_id', type=int, required=False)
+@click.option('--all', 'all_tests', is_flag=True, help='Re-score attempts for every test.')
+@click.option('--batch-size', default=1000, show_default=True, help='History rows graded per UPDATE batch.')
+@with_appcontext
+def rescore_history_command(test_id, all_tests, batch_size):
+    """Re-grade stored History scores against the current answer key and rebuild item statistics."""
+    for tid in _resolve_test_ids(test_id, all_tests):
+        started = time.perf_counter()
+        scanned, updated = rescore_attempts(tid, batch_size=batch_size)
+        elapsed = time.perf_counter() - started
+        click.echo(f'Test {tid}: re-scored {scanned} attempts, {updated} changed ({elapsed:.2f}s)')
+
+@click.command('backfill-item-stats')
+@click.argument('test_id', type=int, required=False)
+@click.option('--all', 'all_tests', is_flag=True, help='Rebuild statistics for every test.')
+@click.option('--batch-size', default=1000, show_default=True, help='History rows read per batch.')
+@with_appcontext
+def backfill_item_stats_command(test_id, all_tests, batch_size):
+    """Rebuild per-question item statistics from stored History."""
+    for tid in _resolve_test_ids(test_id, all_tests):
+        started = time.perf_counter()
+        scanned, questions = backfill_item_stats(tid, batch_size=batch_size)
+        elapsed = time.perf_counter() - started
+        click.echo(f'Test {tid}: {questions} questions from {scanned} attempts ({elapsed:.2f}s)')
+
+@click.command('import-tests')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--overwrite', is_flag=True, help='Replace all existing tests and questions.')
+@click.option('--sync', is_flag=True, help='Update tests that already exist by name, matching questions by id.')
+@click.option('--retire', is_flag=True, help='With --sync, delete questions missing from the bank.')
+@click.option('--batch-size', default=500, show_default=True, help='Questions per executemany batch.')
+@with_appcontext
+def import_tests_command(path, overwrite, sync, retire, batch_size):
+    """Import a JSON or ZIP test bank in a single transaction."""
+    with open(path, 'rb') as f:
+        if path.lower().endswith('.zip'):
+            # Generate image variants before exiting rather than in a background thread
+            current_app.config['IMAGE_BACKGROUND'] = False
+            result = import_zip(f, overwrite=overwrite, batch_size=batch_size, sync=sync, retire=retire)
+            click.echo(f'Saved {result.images} images')
+            for name, error in result.image_errors.items():
+                click.echo(f'  image {name}: {error}')
+        else:
+            result = import_tests(iter_json_tests(f), overwrite=overwrite, batch_size=batch_size, sync=sync, retire=retire)
+    rate = result.questions / result.elapsed if result.elapsed else 0
+    click.echo(f'Imported {result.tests} tests, {result.questions} questions in {result.elapsed:.2f}s ({rate:.0f} questions/s)')
+    if sync:
+        click.echo(f'{result.updated} updated, {result.unchanged} unchanged, {result.retired} retired')
+    for test_name, index, reason in result.skipped:
+        click.echo(f'  skipped question {index} of "{test_name}": {reason}' if index is not None else f'  skipped test: {reason}')
+
+@click.command('dedupe-images')
+@with_appcontext
+def dedupe_images_command():
+    """Move images saved under their upload names into the content-addressed image store."""
+    moved, merged, freed = dedupe_images()
+    click.echo(f'Moved {moved} images into the image store, {merged} duplicates merged, {freed / 1024 / 1024:.1f} MiB freed')
+    if moved:
+        click.echo('Run `flask process-images` to generate their variants.')
+
+@click.command('process-images')
+@click.option('--force', is_flag=True, help='Regenerate variants of every stored image.')
+@click.option('--batch-size', default=200, show_default=True, help='Images per worker pool run.')
+@with_appcontext
+def process_images_command(force, batch_size):
+    """Generate variants for images still waiting for them (e.g. after a restart or dedupe-images)."""
+    if force:
+        ImageBlob.query.update({ImageBlob.processed: False})
+        db.session.commit()
+    started = time.perf_counter()
+    total = failed = 0
+    while True:
+        pending = db.session.scalars(db.select(ImageBlob.name).where(ImageBlob.processed.is_(False)).limit(batch_size)).all()
+        if not pending:
+            break
+        processed, errors = image_processor.process(pending)
+        total += processed
+        failed += len(errors)
+        for name, error in errors.items():
+            click.echo(f'  image {name}: {error}')
+    click.echo(f'Generated variants for {total} images in {time.perf_counter() - started:.2f}s, {failed} failed')
+
+@click.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='Print the full plan of every query.')
+@with_appcontext
+def check_query_plans_command(verbose):
+    """EXPLAIN the hot request queries and fail if any scans a whole table or index.
+
+    tests/test_query_plans.py runs the same check against a seeded
+    production-sized database; this command checks a deployed one
+    (DATA_DIR), whose statistics and schema history may differ.
+    """
+    failures = 0
+    for name, plan, scans in find_full_scans():
+        if scans:
+            failures += 1
+            click.echo(f'SCAN   {name}: {"; ".join(scans)}')
+        else:
+            click.echo(f'ok     {name}')
+        if verbose or scans:
+            for line in plan:
+                click.echo(f'         {line}')
+    if failures:
+        raise click.ClickException(f'{failures} hot queries fall back to a full scan.')
+
+def register_commands(app):
+    app.cli.add_command(bootstrap_command)
+    app.cli.add_command(rescore_history_command)
+    app.cli.add_command(backfill_item_stats_command)
+    app.cli.add_command(import_tests_command)
+    app.cli.add_command(dedupe_images_command)
+    app.cli.add_command(process_images_command)
+    app.cli.add_command(check_query_plans_command)
@@ -12,5 +12,62 @@ class Config:
     DATA_DIR = os.getenv('DATA_DIR', basedir)
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(DATA_DIR, 'studbud.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Per-connection SQLite pragmas, applied in order by database.init_sqlite.
+    # WAL lets readers run alongside the single writer; synchronous=NORMAL is
+    # durable across application crashes in WAL mode and skips an fsync per commit.
+    SQLITE_PRAGMAS = {
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)),  # Wait for locks instead of failing with "database is locked"
+        'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'cache_size': -int(os.getenv('SQLITE_CACHE_SIZE_KB', 20000)),  # Negative means KiB rather than pages
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'temp_store': os.getenv('SQLITE_TEMP_STORE', 'MEMORY'),
+    }
+
+    # Connection pool per worker process; size it to at least the worker's thread count
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 8)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 4)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        'connect_args': {'check_same_thread': False},
+    }
     
-    UPLOAD_FOLDER = os.path.join(basedir, 'static', 'uploads')  # Path for image uploads (e.g., network topologies)
\ No newline at end of file
+    UPLOAD_FOLDER = os.path.join(basedir, 'static', 'uploads')  # Path for image uploads (e.g., network topologies)
+
+    # Let the front proxy send image bytes: '' (Python sends them), 'x-accel-redirect' (nginx) or 'x-sendfile'
+    IMAGE_OFFLOAD = os.getenv('IMAGE_OFFLOAD', '').lower()
+    IMAGE_ACCEL_PREFIX = os.getenv('IMAGE_ACCEL_PREFIX', '/protected-uploads/')  # nginx internal location aliased to UPLOAD_FOLDER
+
+    # Built export ZIPs, keyed by the revisions of the tests they contain and evicted LRU past the size cap
+    EXPORT_CACHE_DIR = os.getenv('EXPORT_CACHE_DIR', os.path.join(DATA_DIR, 'export_cache'))
+    EXPORT_CACHE_MAX_BYTES = int(os.getenv('EXPORT_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+
+    # Image variants (see images.VARIANTS) are generated off the request path by a background thread,
+    # in batches of up to IMAGE_BATCH_SIZE images over IMAGE_WORKERS processes (default: one per CPU)
+    IMAGE_BACKGROUND = os.getenv('IMAGE_BACKGROUND', 'true').lower() == 'true'
+    IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 0)) or None
+    IMAGE_BATCH_SIZE = int(os.getenv('IMAGE_BATCH_SIZE', 64))
+
+    # Number of per-test compiled answer keys kept in memory for grading
+    ANSWER_KEY_CACHE_SIZE = int(os.getenv('ANSWER_KEY_CACHE_SIZE', 64))
+
+    # Rendered study/flashcard question lists kept in memory, bounded by count and total size
+    FRAGMENT_CACHE_SIZE = int(os.getenv('FRAGMENT_CACHE_SIZE', 32))
+    FRAGMENT_CACHE_MAX_BYTES = int(os.getenv('FRAGMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+    # Questions rendered inline on study/flashcard pages and per API chunk after that
+    QUESTION_CHUNK_SIZE = int(os.getenv('QUESTION_CHUNK_SIZE', 50))
+
+    # Attempts per page on the history page
+    HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 25))
+
+    # Write-behind buffering of study/flashcard History rows (see history_writer.py)
+    HISTORY_WRITE_BEHIND = os.getenv('HISTORY_WRITE_BEHIND', 'true').lower() == 'true'
+    HISTORY_FLUSH_INTERVAL_MS = int(os.getenv('HISTORY_FLUSH_INTERVAL_MS', 50))
+    HISTORY_FLUSH_ROWS = int(os.getenv('HISTORY_FLUSH_ROWS', 200))
+    HISTORY_QUEUE_SIZE = int(os.getenv('HISTORY_QUEUE_SIZE', 10000))
+
+    # Flashcard review sessions: max due cards and never-reviewed cards per session
+    FLASHCARD_SESSION_LIMIT = int(os.getenv('FLASHCARD_SESSION_LIMIT', 100))
+    FLASHCARD_NEW_CARDS = int(os.getenv('FLASHCARD_NEW_CARDS', 20))
\ No newline at end of file
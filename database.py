@@ -0,0 +1,42 @@
+from flask import current_app
+from sqlalchemy import event
+from extensions import db
+import re
+
+_PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+
+def init_sqlite(app):
+    """Apply SQLITE_PRAGMAS to every new SQLite connection of the app's engine.
+
+    Must run right after db.init_app(app), before the first connection is made.
+    """
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    for name in pragmas:
+        if not _PRAGMA_NAME.match(name):
+            raise ValueError(f'Invalid SQLite pragma name: {name}')
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
+
+def sqlite_profile():
+    """Effective pragma values and pool settings as seen by a pooled connection."""
+    engine = db.engine
+    profile = {}
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store'):
+                profile[name] = conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+    options = current_app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    profile['pool_size'] = engine.pool.size() if hasattr(engine.pool, 'size') else None
+    profile['max_overflow'] = options.get('max_overflow')
+    return profile
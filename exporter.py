@@ -0,0 +1,156 @@
+from datetime import datetime
+from flask import current_app
+from extensions import db
+from models import Test, Question
+from cache import FileCache
+import hashlib
+import json
+import logging
+import os
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+# Already-compressed formats are stored as-is; deflating them costs CPU and saves nothing
+_STORED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+_COPY_CHUNK = 1024 * 1024
+# Part of every export revision; bump it when the archive layout changes so cached exports are rebuilt
+_EXPORT_FORMAT = 2
+
+def question_export(q):
+    """Bank representation of one question, as read back by the importer.
+
+    The id is the question's source key when it has one, so a sync import
+    of the export matches the same questions again.
+    """
+    key = q.source_key
+    question_data = {
+        'id': (int(key) if key.isdigit() else key) if key else q.id,
+        'type': q.type,
+        'text': q.text,
+        'explanation': q.explanation,
+        'image': q.image
+    }
+    if q.type == 'match':
+        options = json.loads(q.options or '{}')
+        question_data['terms'] = options.get('terms', [])
+        question_data['definitions'] = options.get('definitions', [])
+        question_data['correct_mappings'] = json.loads(q.correct or '{}')
+    else:
+        question_data['options'] = json.loads(q.options or '[]')
+        question_data['correct'] = q.correct
+    return question_data
+
+def iter_tests_json(test_ids, images, batch_size=500):
+    """Yield the JSON bank for the given tests as text fragments, one question at a time.
+
+    Questions are read in keyset-paginated batches, so memory does not grow
+    with the size of a test. Image filenames referenced by exported
+    questions are added to the images set.
+    """
+    yield '['
+    separator = ''
+    for test_id in test_ids:
+        test = db.session.get(Test, test_id)
+        if test is None:
+            continue
+        header = json.dumps({'test_name': test.name, 'description': test.description}, ensure_ascii=False)
+        yield separator + header[:-1] + ', "questions": ['
+        separator = ','
+        exported = 0
+        last_id = 0
+        while True:
+            batch = Question.query.filter(Question.test_id == test_id, Question.id > last_id).order_by(Question.id).limit(batch_size).all()
+            if not batch:
+                break
+            for q in batch:
+                try:
+                    fragment = json.dumps(question_export(q), ensure_ascii=False)
+                except json.JSONDecodeError as e:
+                    logger.warning(f'Skipping question ID {q.id} due to invalid JSON: {str(e)}')
+                    continue
+                yield (',' if exported else '') + fragment
+                exported += 1
+                if q.image:
+                    images.add(q.image)
+                db.session.expunge(q)
+            last_id = batch[-1].id
+        yield ']}'
+        logger.debug(f'Exported test "{test.name}" with {exported} questions')
+    yield ']'
+
+class _StreamSink:
+    """Write-only file object that hands zipfile output to a generator."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def stream_tests_zip(test_ids):
+    """Yield a ZIP archive of the given tests and their images as it is produced.
+
+    zipfile writes to an unseekable sink (so it emits data descriptors), and
+    whatever it has written is yielded after each JSON fragment or image
+    chunk, keeping memory constant however large the image library is.
+    """
+    sink = _StreamSink()
+    images = set()
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    now = datetime.now().timetuple()[:6]
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        info = zipfile.ZipInfo('test_data.json', date_time=now)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with zip_file.open(info, 'w', force_zip64=True) as dest:
+            for fragment in iter_tests_json(test_ids, images):
+                dest.write(fragment.encode('utf-8'))
+                yield sink.drain()
+        for image in sorted(images):
+            image_path = os.path.join(upload_folder, image)
+            if not os.path.isfile(image_path):
+                continue
+            info = zipfile.ZipInfo.from_file(image_path, f'images/{image}')
+            info.compress_type = zipfile.ZIP_STORED if os.path.splitext(image)[1].lower() in _STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+            with open(image_path, 'rb') as src, zip_file.open(info, 'w') as dest:
+                while True:
+                    chunk = src.read(_COPY_CHUNK)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield sink.drain()
+    yield sink.drain()
+    logger.debug(f'Exported {len(test_ids)} tests with {len(images)} images')
+
+def export_revision(test_ids=None):
+    """Resolve the tests to export and the content revision of their archive.
+
+    The revision is a digest of each test's ID and revision, so editing,
+    adding or deleting any included test changes it. It serves as both the
+    export cache key and the ETag.
+
+    Args:
+        test_ids: IDs of the tests to export, or None for every test
+
+    Returns:
+        tuple: (existing test IDs in export order, revision hex digest)
+    """
+    query = db.session.query(Test.id, Test.revision).order_by(Test.id)
+    if test_ids is not None:
+        query = query.filter(Test.id.in_(test_ids))
+    rows = query.all()
+    content = f'{_EXPORT_FORMAT}|' + ','.join(f'{test_id}:{revision}' for test_id, revision in rows)
+    return [test_id for test_id, _ in rows], hashlib.sha256(content.encode()).hexdigest()[:32]
+
+def export_cache():
+    """On-disk cache of built export archives, shared by every worker."""
+    return FileCache(current_app.config['EXPORT_CACHE_DIR'], current_app.config['EXPORT_CACHE_MAX_BYTES'], suffix='.zip')
@@ -1,3 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
+from history_writer import HistoryWriter
+from image_processor import ImageProcessor
 
-db = SQLAlchemy()
\ No newline at end of file
+db = SQLAlchemy()
+history_writer = HistoryWriter()
+image_processor = ImageProcessor()
@@ -151,6 +151,8 @@ class QuestionForm(FlaskForm):
 class ImportForm(FlaskForm):
     json_file = FileField('Upload JSON or ZIP File')
     overwrite = BooleanField('Overwrite Existing Tests')
+    sync = BooleanField('Update Existing Tests In Place')
+    retire = BooleanField('Remove Questions Missing From The File')
     submit = SubmitField('Import')
 
 class SimStartForm(FlaskForm):
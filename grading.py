@@ -0,0 +1,171 @@
+from collections import namedtuple
+from extensions import db
+from models import Question, History
+from cache import LRUCache
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Compiled answer for a single question.
+#   expected: value compared against the user's answer
+#             (sorted tuple for mrq, lowercased str for tf, dict for match, str otherwise)
+#   correct:  value returned to the client as the correct answer
+CompiledQuestion = namedtuple('CompiledQuestion', ['type', 'expected', 'correct'])
+
+_answer_keys = LRUCache(maxsize=64)
+
+def compile_question(question_type, correct):
+    """Parse a question's stored correct answer once into a grading-ready form."""
+    if question_type == 'match':
+        try:
+            mappings = json.loads(correct or '{}')
+        except json.JSONDecodeError:
+            logger.warning(f'Invalid match mappings in answer key: {correct}')
+            mappings = {}
+        if not isinstance(mappings, dict):
+            mappings = {}
+        return CompiledQuestion(question_type, mappings, mappings)
+    if question_type == 'mrq':
+        expected = tuple(sorted(correct.split(', '))) if correct else ()
+        return CompiledQuestion(question_type, expected, correct)
+    if question_type == 'tf':
+        return CompiledQuestion(question_type, str(correct).lower(), correct)
+    return CompiledQuestion(question_type, correct, correct)
+
+def grade_answer(compiled, user_ans):
+    """Score one answer against a compiled question (0..1, fractional for match)."""
+    if compiled.type == 'mrq':
+        if not isinstance(user_ans, list):
+            user_ans = []
+        # Compared as sorted sequences, so repeated selections do not match
+        return 1 if tuple(sorted(user_ans)) == compiled.expected else 0
+    if compiled.type == 'tf':
+        return 1 if str(user_ans).lower() == compiled.expected else 0
+    if compiled.type == 'match':
+        mappings = compiled.expected
+        if not mappings or not user_ans or not isinstance(user_ans, dict):
+            return 0.0
+        return sum(1 for term_id, def_id in user_ans.items()
+                   if mappings.get(term_id) == def_id) / len(mappings)
+    return 1 if user_ans == compiled.expected else 0
+
+def answer_key_query(test_id):
+    """Query for the (id, type, correct) rows of every question in a test."""
+    return db.session.query(Question.id, Question.type, Question.correct).filter_by(test_id=test_id)
+
+def build_answer_key(test_id):
+    """Load and compile the answer key for every question in a test."""
+    return {q_id: compile_question(q_type, correct) for q_id, q_type, correct in answer_key_query(test_id).all()}
+
+def init_answer_key_cache(app):
+    """Size the compiled answer key cache from ANSWER_KEY_CACHE_SIZE."""
+    _answer_keys.maxsize = app.config.get('ANSWER_KEY_CACHE_SIZE', _answer_keys.maxsize)
+
+def get_answer_key(test_id, revision=None):
+    """Return the compiled answer key for a test, building it on a cache miss.
+
+    Keys are cached per (test_id, revision) so a revision bump made by another
+    worker process is picked up without explicit invalidation.
+    """
+    answer_key = _answer_keys.get((test_id, revision))
+    if answer_key is None:
+        answer_key = build_answer_key(test_id)
+        _answer_keys.set((test_id, revision), answer_key)
+        logger.debug(f'Compiled answer key for test ID {test_id} (revision {revision}): {len(answer_key)} questions')
+    return answer_key
+
+def invalidate_answer_key(test_id=None):
+    """Drop the cached answer keys for a test, or every cached key if test_id is None."""
+    if test_id is None:
+        _answer_keys.clear()
+    else:
+        _answer_keys.discard_where(lambda key: key[0] == test_id)
+
+def grade_answers(mode, answers, answer_key):
+    """Grade a stored History answers blob question by question.
+
+    Returns:
+        dict: question ID -> score, or None for modes whose score is not derived
+        from the answer key (e.g. flashcard reviews, which record a self-reported score)
+    """
+    if mode not in ('study', 'sim') or not isinstance(answers, dict):
+        return None
+    scores = {}
+    for q_id, user_ans in answers.items():
+        try:
+            q_id = int(q_id)
+        except (TypeError, ValueError):
+            continue
+        compiled = answer_key.get(q_id)
+        if compiled is None:
+            continue
+        if mode == 'study' and compiled.type != 'match':
+            # Study rows wrap the answer as {question_id: {question_id: answer}}
+            user_ans = user_ans.get(str(q_id)) if isinstance(user_ans, dict) else None
+        scores[q_id] = grade_answer(compiled, user_ans)
+    return scores
+
+def regrade_answers(mode, answers, answer_key):
+    """Recompute the score of a stored History answers blob (None if not graded)."""
+    scores = grade_answers(mode, answers, answer_key)
+    return sum(scores.values()) if scores is not None else None
+
+def history_batch_query(test_id, columns, batch_size):
+    """One keyset batch of a test's History rows: the id and the named columns, after the :last_id bind parameter."""
+    history = History.__table__
+    return db.select(history.c.id, *(history.c[name] for name in columns)).where(
+        history.c.test_id == test_id, history.c.id > db.bindparam('last_id')
+    ).order_by(history.c.id).limit(batch_size)
+
+def iter_history_batches(test_id, columns, batch_size=1000, after=0):
+    """Yield a test's History rows in batches, keyset-paginated over History.id.
+
+    Rows are plain Core rows (nothing enters the ORM identity map) of the id
+    followed by the named columns. Each batch is a fresh query, so callers
+    may commit between batches.
+
+    Args:
+        after: Only rows with a greater ID
+    """
+    select_batch = history_batch_query(test_id, columns, batch_size)
+    last_id = after
+    while True:
+        rows = db.session.execute(select_batch, {'last_id': last_id}).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+def rescore_history(test_id, batch_size=1000):
+    """Re-grade every stored attempt for a test against its current answer key.
+
+    Rows are streamed with iter_history_batches, each answers blob is decoded
+    once, and changed scores are written back with one executemany UPDATE per
+    batch.
+
+    Returns:
+        tuple: (rows_scanned, rows_updated)
+    """
+    answer_key = build_answer_key(test_id)
+    history = History.__table__
+    update_score = history.update().where(history.c.id == db.bindparam('row_id')).values(score=db.bindparam('new_score'))
+
+    scanned = updated = 0
+    for rows in iter_history_batches(test_id, ('mode', 'score', 'answers'), batch_size):
+        changes = []
+        for row_id, mode, old_score, answers in rows:
+            try:
+                new_score = regrade_answers(mode, json.loads(answers or '{}'), answer_key)
+            except json.JSONDecodeError:
+                logger.warning(f'Skipping History ID {row_id} with invalid answers JSON')
+                continue
+            if new_score is not None and new_score != old_score:
+                changes.append({'row_id': row_id, 'new_score': new_score})
+        if changes:
+            db.session.execute(update_score, changes)
+        db.session.commit()
+        scanned += len(rows)
+        updated += len(changes)
+    logger.info(f'Re-scored test ID {test_id}: {updated} of {scanned} attempts changed')
+    return scanned, updated
@@ -0,0 +1,50 @@
+"""Gunicorn settings for StudBud (gunicorn -c gunicorn.conf.py wsgi:app).
+
+Every value can be overridden with the matching GUNICORN_* environment variable.
+SQLite allows one writer at a time, so the worker count is capped rather than
+growing with the CPU count; WAL mode and busy_timeout (see Config.SQLITE_PRAGMAS)
+let the capped workers read concurrently and queue briefly for the write lock.
+Run `flask bootstrap` once before starting, so workers never race on schema
+migrations or the admin user.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:3000')
+
+# Threaded workers: requests mostly wait on SQLite or the client, so threads
+# give concurrency without multiplying per-process caches
+worker_class = 'gthread'
+workers = int(os.getenv('GUNICORN_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, int(os.getenv('GUNICORN_MAX_WORKERS', 4)))))
+threads = int(os.getenv('GUNICORN_THREADS', 4))  # Keep at or below DB_POOL_SIZE
+
+# Import the app once in the master and fork it, so workers start without re-importing
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Recycle workers now and then to bound memory growth of the in-process caches
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOGLEVEL', 'info')
+
+
+def post_fork(server, worker):
+    # SQLite connections must not cross a fork; drop any the master opened
+    from extensions import db
+    from app import app
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    # Write out buffered study/flashcard History rows before the worker goes away;
+    # images still waiting for variants stay pending for `flask process-images`
+    from extensions import history_writer, image_processor
+    history_writer.shutdown()
+    image_processor.shutdown()
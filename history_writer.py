@@ -0,0 +1,89 @@
+from datetime import datetime
+from background import BackgroundWorker
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+class HistoryWriter(BackgroundWorker):
+    """Write-behind buffer for per-answer History rows.
+
+    Study answers and flashcard reviews are queued and inserted by a
+    background thread in one transaction per group (every
+    HISTORY_FLUSH_INTERVAL_MS or HISTORY_FLUSH_ROWS rows, whichever comes
+    first), so concurrent studiers share one SQLite write lock acquisition
+    and fsync instead of taking one each. The queue is bounded: when it is
+    full, add() waits up to HISTORY_ENQUEUE_TIMEOUT seconds and then falls
+    back to a synchronous insert. Pending rows are flushed at interpreter
+    shutdown. Item-statistics deltas and flashcard reviews passed along
+    with a row are applied in the same transaction as its group.
+    """
+
+    thread_name = 'history-writer'
+
+    def init_app(self, app):
+        super().init_app(app)
+        app.config.setdefault('HISTORY_WRITE_BEHIND', True)
+        app.config.setdefault('HISTORY_FLUSH_INTERVAL_MS', 50)
+        app.config.setdefault('HISTORY_FLUSH_ROWS', 200)
+        app.config.setdefault('HISTORY_QUEUE_SIZE', 10000)
+        app.config.setdefault('HISTORY_ENQUEUE_TIMEOUT', 0.5)
+        app.extensions['history_writer'] = self
+
+    def _batch_limits(self):
+        return self.app.config['HISTORY_FLUSH_ROWS'], self.app.config['HISTORY_FLUSH_INTERVAL_MS'] / 1000
+
+    def _queue_size(self):
+        return self.app.config['HISTORY_QUEUE_SIZE']
+
+    def add(self, stats=None, review=None, **row):
+        """Record one History row, buffered when write-behind is enabled.
+
+        stats: optional QuestionStats deltas from item_stats.item_deltas
+        review: optional flashcard review for scheduler.apply_reviews, as
+            (user_id, test_id, question_id, quality); it is dated like the row
+        """
+        row.setdefault('date', datetime.utcnow())
+        if stats:
+            row['_stats'] = stats
+        if review:
+            row['_review'] = (*review, row['date'])
+        config = self.app.config
+        if not config['HISTORY_WRITE_BEHIND'] or self.app.testing:
+            self._insert([row])
+            return
+        try:
+            self._put(row, timeout=config['HISTORY_ENQUEUE_TIMEOUT'])
+        except queue.Full:
+            logger.warning('History write queue full; writing synchronously')
+            self._insert([row])
+
+    def _handle(self, rows):
+        with self.app.app_context():
+            try:
+                self._insert(rows)
+                logger.debug(f'Flushed {len(rows)} History rows')
+            except Exception as e:
+                logger.error(f'Error flushing {len(rows)} History rows, retrying once: {str(e)}')
+                try:
+                    self._insert(rows)
+                except Exception as e:
+                    logger.error(f'Dropped {len(rows)} History rows: {str(e)} {rows}')
+
+    def _insert(self, rows):
+        from extensions import db
+        from models import History
+        from item_stats import apply_deltas
+        from scheduler import apply_reviews
+        try:
+            db.session.execute(db.insert(History), [{k: v for k, v in row.items() if not k.startswith('_')} for row in rows])
+            apply_deltas([delta for row in rows for delta in row.get('_stats', ())])
+            apply_reviews([row['_review'] for row in rows if '_review' in row])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            if threading.current_thread() is self._thread:
+                db.session.remove()
@@ -0,0 +1,79 @@
+from background import BackgroundWorker
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+class ImageProcessor(BackgroundWorker):
+    """Background generation of image variants (see images.VARIANTS).
+
+    Blob names passed to submit() are queued and handled by a per-process
+    background thread, which batches whatever is waiting and renders it in
+    a pool of IMAGE_WORKERS spawned processes, so request threads never
+    decode an image. ImageBlob.processed records completion: submitting an
+    already processed image is a no-op, and images still pending when a
+    worker stops are picked up by `flask process-images`. Until its
+    variants exist, an image is served in its original form.
+    """
+
+    thread_name = 'image-processor'
+    # Pending images stay unprocessed in the database for `flask process-images`
+    drain_on_shutdown = False
+
+    def init_app(self, app):
+        super().init_app(app)
+        app.config.setdefault('IMAGE_BACKGROUND', True)
+        app.config.setdefault('IMAGE_BATCH_SIZE', 64)
+        app.extensions['image_processor'] = self
+
+    def _batch_limits(self):
+        return self.app.config['IMAGE_BATCH_SIZE'], 0
+
+    def submit(self, names):
+        """Queue images for variant generation; call after committing their ImageBlob rows."""
+        names = [name for name in names if name]
+        if not names:
+            return
+        if not self.app.config['IMAGE_BACKGROUND'] or self.app.testing:
+            self.process(names, max_workers=1)
+            return
+        for name in names:
+            self._put(name)
+
+    def _handle(self, batch):
+        from extensions import db
+        with self.app.app_context():
+            try:
+                self.process(batch)
+            except Exception as e:
+                logger.error(f'Error generating variants for {len(batch)} images: {str(e)}')
+            finally:
+                db.session.remove()
+
+    def process(self, names, max_workers=None):
+        """Generate variants for the given images that have none yet, and mark them processed.
+
+        An image that fails is still marked processed (and keeps being
+        served in its original form) so it is not retried forever.
+
+        Returns:
+            tuple: (images processed, dict mapping image names to errors)
+        """
+        from extensions import db
+        from models import ImageBlob
+        from images import make_variants_batch
+        pending = db.session.scalars(db.select(ImageBlob.name).where(
+            ImageBlob.name.in_(set(names)), ImageBlob.processed.is_(False)
+        )).all()
+        if not pending:
+            return 0, {}
+        upload_folder = self.app.config['UPLOAD_FOLDER']
+        paths = {os.path.join(upload_folder, name): name for name in pending}
+        failed = make_variants_batch(paths, max_workers=max_workers or self.app.config.get('IMAGE_WORKERS'))
+        ImageBlob.query.filter(ImageBlob.name.in_(pending)).update({ImageBlob.processed: True}, synchronize_session=False)
+        db.session.commit()
+        errors = {paths[path]: error for path, error in failed.items()}
+        for name, error in errors.items():
+            logger.warning(f'Image {name} is served without variants: {error}')
+        logger.info(f'Generated variants for {len(pending)} images, {len(errors)} failed')
+        return len(pending), errors
@@ -0,0 +1,247 @@
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from flask import current_app, request, abort
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename, send_file
+from extensions import db
+from models import Test, Question, ImageBlob
+from images import VARIANTS, variant_name
+from urllib.parse import quote
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+_COPY_CHUNK = 1024 * 1024
+_LOOKUP_BATCH = 500
+# Names given by the store: SHA-256 of the original, then the extension
+_BLOB_NAME = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+def _upload_folder():
+    return current_app.config['UPLOAD_FOLDER']
+
+def _blob_name(digest, filename):
+    return f'{digest}{os.path.splitext(filename)[1].lower()}'
+
+def hash_file(path):
+    """SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_COPY_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def receive_image(src, filename, upload_folder=None):
+    """Copy an image stream to a temporary file in the uploads folder, hashing it on the way.
+
+    The temporary file keeps the extension of filename, which store_images
+    keeps when it gives the file its final name.
+
+    Returns:
+        tuple: (temporary file path, SHA-256 hex digest of the bytes received)
+    """
+    upload_folder = upload_folder or _upload_folder()
+    os.makedirs(upload_folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=upload_folder, prefix='.incoming-', suffix=os.path.splitext(filename)[1].lower())
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: src.read(_COPY_CHUNK), b''):
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest()
+
+def find_blobs(digests):
+    """Names of stored images matching the given digests.
+
+    Returns:
+        dict: digest -> blob name, for each digest already in the store
+    """
+    digests = list(set(digests))
+    found = {}
+    for start in range(0, len(digests), _LOOKUP_BATCH):
+        batch = digests[start:start + _LOOKUP_BATCH]
+        found.update(db.session.query(ImageBlob.digest, ImageBlob.name).filter(ImageBlob.digest.in_(batch)).all())
+    return found
+
+def _adopt(tmp_path, digest, upload_folder):
+    """Rename a received temporary file to its content hash and record the blob (caller commits)."""
+    name = _blob_name(digest, tmp_path)
+    path = os.path.join(upload_folder, name)
+    if os.path.exists(path):
+        # Written by an import whose transaction was rolled back
+        os.unlink(tmp_path)
+    else:
+        os.chmod(tmp_path, 0o644)  # mkstemp creates files readable by the owner only
+        os.replace(tmp_path, path)
+    db.session.execute(sqlite_insert(ImageBlob).values(
+        name=name, digest=digest, size=os.path.getsize(path),
+    ).on_conflict_do_nothing())
+    return name
+
+def store_images(received):
+    """Add received images to the content-addressed store as they are (caller commits).
+
+    Images whose bytes are already stored, or repeated within received,
+    are dropped; only new content is written. Originals are kept full-size;
+    pass the returned new names to image_processor.submit once committed to
+    generate their variants.
+
+    Args:
+        received: Dict mapping any key to a (temporary path, digest) pair from receive_image
+
+    Returns:
+        tuple: (names, new)
+            names: Dict mapping each key to its blob name
+            new: Blob names written by this call
+    """
+    upload_folder = _upload_folder()
+    blobs = find_blobs(digest for _, digest in received.values())
+    new = []
+    for tmp_path, digest in received.values():
+        if digest in blobs:
+            os.unlink(tmp_path)
+        else:
+            blobs[digest] = _adopt(tmp_path, digest, upload_folder)
+            new.append(blobs[digest])
+    logger.info(f'Stored {len(received)} images: {len(new)} new, {len(received) - len(new)} already stored')
+    return {key: blobs[digest] for key, (_, digest) in received.items()}, new
+
+def save_upload(file):
+    """Store an uploaded image (a FileStorage) and return its blob name (caller commits, then submits it for processing)."""
+    tmp_path, digest = receive_image(file.stream, secure_filename(file.filename))
+    names, _ = store_images({file.filename: (tmp_path, digest)})
+    return names[file.filename]
+
+def send_image(filename, variant=None):
+    """Response for an image from the store, or one of its variants once generated.
+
+    Store names are content hashes, so their URLs are fingerprints: the
+    bytes behind them never change. They are sent with a strong ETag derived
+    from the name and cached as immutable for a year. The original standing
+    in for a variant that is not generated yet, and images still under a
+    legacy upload name, are revalidated on every use instead.
+
+    With IMAGE_OFFLOAD set, the bytes are left to the front proxy:
+    'x-accel-redirect' (nginx) redirects internally to IMAGE_ACCEL_PREFIX,
+    'x-sendfile' (Apache, lighttpd) names the file's path.
+    """
+    upload_folder = _upload_folder()
+    served = filename
+    fingerprinted = bool(_BLOB_NAME.match(filename))
+    if variant in VARIANTS:
+        candidate = variant_name(filename, variant)
+        if os.path.isfile(safe_join(upload_folder, candidate) or ''):
+            served = candidate
+        else:
+            fingerprinted = False
+    path = safe_join(upload_folder, served)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    offload = current_app.config.get('IMAGE_OFFLOAD')
+    if offload == 'x-accel-redirect':
+        # nginx serves the file, conditional requests included; only the caching headers come from here
+        response = current_app.response_class(mimetype=mimetypes.guess_type(served)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = current_app.config['IMAGE_ACCEL_PREFIX'].rstrip('/') + '/' + quote(served)
+    else:
+        response = send_file(path, request.environ, etag=served if fingerprinted else True,
+                             max_age=_IMMUTABLE_MAX_AGE if fingerprinted else None,
+                             use_x_sendfile=offload == 'x-sendfile')
+    if fingerprinted:
+        response.cache_control.public = True
+        response.cache_control.max_age = _IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+def release_images(names):
+    """Delete image files that no question references any more, and commit.
+
+    Call after committing the change that dropped the references.
+    """
+    names = {name for name in names if name}
+    if not names:
+        return
+    referenced = set(db.session.scalars(db.select(Question.image).where(Question.image.in_(names)).distinct()))
+    unused = names - referenced
+    for name in unused:
+        for filename in [name] + [variant_name(name, variant) for variant in VARIANTS]:
+            full_path = os.path.join(_upload_folder(), filename)
+            try:
+                os.remove(full_path)
+                logger.debug(f"Deleted image: {full_path}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f'Error deleting image {full_path}: {str(e)}')
+    if unused:
+        ImageBlob.query.filter(ImageBlob.name.in_(unused)).delete(synchronize_session=False)
+        db.session.commit()
+
+def dedupe_images():
+    """Move images stored under their upload names into the content-addressed store.
+
+    Each legacy file is hashed once; identical files collapse onto one blob
+    and question references are rewritten. Files are linked under their
+    new name before the commit and the old names removed after it, so a
+    failure leaves every reference valid.
+
+    Moved images still need their variants: run image_processor.process
+    (or `flask process-images`) afterwards.
+
+    Returns:
+        tuple: (legacy files moved, files merged into an existing blob, bytes freed)
+    """
+    upload_folder = _upload_folder()
+    legacy = db.session.scalars(
+        db.select(Question.image).where(Question.image.is_not(None), Question.image.not_in(db.select(ImageBlob.name))).distinct()
+    ).all()
+    renames = {}
+    merged = freed = 0
+    for name in legacy:
+        path = os.path.join(upload_folder, name)
+        if not os.path.isfile(path):
+            logger.warning(f'Image {name} is referenced but missing, left as is')
+            continue
+        digest = hash_file(path)
+        blob = find_blobs([digest]).get(digest)
+        if blob:
+            merged += 1
+            freed += os.path.getsize(path)
+        else:
+            blob = _blob_name(digest, name)
+            blob_path = os.path.join(upload_folder, blob)
+            if not os.path.exists(blob_path):
+                try:
+                    os.link(path, blob_path)
+                except OSError:
+                    shutil.copy2(path, blob_path)
+            db.session.execute(sqlite_insert(ImageBlob).values(
+                name=blob, digest=digest, size=os.path.getsize(blob_path),
+            ).on_conflict_do_nothing())
+        renames[name] = blob
+    if not renames:
+        return 0, 0, 0
+    test_ids = set()
+    for name, blob in renames.items():
+        test_ids.update(db.session.scalars(db.select(Question.test_id).where(Question.image == name).distinct()))
+        Question.query.filter_by(image=name).update({Question.image: blob}, synchronize_session=False)
+    # Rendered question pages embed image URLs
+    Test.query.filter(Test.id.in_(test_ids)).update({Test.revision: Test.revision + 1}, synchronize_session=False)
+    db.session.commit()
+    for name in renames:
+        try:
+            os.remove(os.path.join(upload_folder, name))
+        except OSError as e:
+            logger.error(f'Error deleting legacy image {name}: {str(e)}')
+    logger.info(f'Moved {len(renames)} legacy images into the image store, {merged} merged, {freed} bytes freed')
+    return len(renames), merged, freed
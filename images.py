@@ -0,0 +1,79 @@
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import multiprocessing
+import os
+
+logger = logging.getLogger(__name__)
+
+# Sizes generated for every stored image: name -> (max width in pixels, file extension or None for the original's)
+VARIANTS = {
+    'display': (800, None),  # Shown on question pages
+    'preview': (240, None),  # Thumbnails in admin lists and result tables
+    'webp': (800, '.webp'),  # Display size for browsers that accept WebP
+}
+
+def variant_name(filename, variant):
+    """File name of one variant of an image, e.g. abc.png -> abc.800.png."""
+    width, ext = VARIANTS[variant]
+    stem, original_ext = os.path.splitext(filename)
+    return f'{stem}.{width}{ext or original_ext.lower()}'
+
+def make_variants(file_path):
+    """Write every VARIANTS size next to an original image, which is left untouched.
+
+    Images narrower than a variant are re-encoded at their own size. A
+    variant that cannot be written (e.g. no WebP support in this Pillow
+    build) is skipped so the others still exist.
+
+    Returns:
+        dict: variant name -> error message, for each variant that failed
+    """
+    from PIL import Image  # Imported on first use to keep worker startup fast
+    errors = {}
+    folder, filename = os.path.split(file_path)
+    with Image.open(file_path) as original:
+        original.load()
+        for variant, (width, ext) in VARIANTS.items():
+            target = os.path.join(folder, variant_name(filename, variant))
+            try:
+                img = original.copy()
+                img.thumbnail((width, width * 8))
+                if target.lower().endswith(('.jpg', '.jpeg')) and img.mode not in ('RGB', 'L'):
+                    img = img.convert('RGB')
+                # Written under a temporary name so a half-written variant is never served
+                tmp_path = f'{target}.tmp'
+                img.save(tmp_path, format=Image.registered_extensions().get(os.path.splitext(target)[1].lower()),
+                         optimize=True, quality=85)
+                os.replace(tmp_path, target)
+            except Exception as e:
+                errors[variant] = f'{type(e).__name__}: {e}'
+                logger.error(f"Error writing {variant} variant of {file_path}: {str(e)}")
+    logger.debug(f"Generated variants of image: {file_path}")
+    return errors
+
+def _variants_one(file_path):
+    # Runs in a pool process; report the error instead of raising so one bad image does not stop the batch
+    try:
+        errors = make_variants(file_path)
+        return '; '.join(f'{variant}: {error}' for variant, error in errors.items()) or None
+    except Exception as e:
+        return f'{type(e).__name__}: {e}'
+
+def make_variants_batch(file_paths, max_workers=None):
+    """Generate variants for many images in a pool of processes.
+
+    Each process holds one decoded image at a time, so memory is bounded by
+    max_workers images regardless of how many are queued. Processes are
+    spawned rather than forked, which is safe from threaded server workers.
+
+    Returns:
+        dict: file path -> error message, for each image that failed
+    """
+    file_paths = list(file_paths)
+    max_workers = max(1, min(max_workers or os.cpu_count() or 1, len(file_paths)))
+    if max_workers == 1:
+        results = map(_variants_one, file_paths)
+        return {path: error for path, error in zip(file_paths, results) if error}
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        results = pool.map(_variants_one, file_paths, chunksize=4)
+        return {path: error for path, error in zip(file_paths, results) if error}
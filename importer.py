@@ -0,0 +1,373 @@
+from collections import namedtuple
+from extensions import db, image_processor
+from models import Test, Question, CardState, QuestionStats
+from grading import invalidate_answer_key
+from utils import normalize_image_path, extract_zip_images
+from image_store import store_images, release_images
+import hashlib
+import io
+import json
+import logging
+import time
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+# Outcome of one import run.
+#   skipped: list of (test_name, question_index, reason); question_index is None for a skipped test
+#   questions: questions inserted
+#   images: number of images saved from a ZIP bank
+#   image_errors: dict mapping image names to why they failed to extract
+#   updated, unchanged, retired: existing questions changed, left alone and deleted by a sync import
+ImportResult = namedtuple('ImportResult', ['tests', 'questions', 'skipped', 'elapsed', 'images', 'image_errors',
+                                           'updated', 'unchanged', 'retired'],
+                          defaults=(0, {}, 0, 0, 0))
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\r\n'
+
+def iter_json_tests(fileobj, chunk_size=1024 * 1024):
+    """Yield test dicts one at a time from a JSON bank (a list of tests, or a single test object).
+
+    Only the test currently being decoded is held in memory, not the whole
+    file. The read size doubles while a single test is incomplete, so very
+    large tests are still decoded in linear time. Binary streams are read as
+    UTF-8 (with or without BOM).
+    """
+    if isinstance(fileobj.read(0), bytes):
+        fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig')
+    buffer = ''
+    pos = 0
+    eof = False
+    in_list = None
+    read_size = chunk_size
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        if pos >= len(buffer) and not eof:
+            data = fileobj.read(read_size)
+            eof = not data
+            buffer, pos = buffer[pos:] + data, 0
+            continue
+        if pos >= len(buffer):
+            break
+        char = buffer[pos]
+        if in_list is None:
+            in_list = char == '['
+            if in_list:
+                pos += 1
+                continue
+        elif in_list and char in ',]':
+            pos += 1
+            if char == ']':
+                break
+            continue
+        try:
+            item, pos = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Most likely an incomplete test: read more, doubling the read each time
+            read_size = max(read_size, len(buffer) - pos)
+            data = fileobj.read(read_size)
+            eof = not data
+            buffer, pos = buffer[pos:] + data, 0
+            continue
+        read_size = chunk_size
+        yield item
+        if not in_list:
+            break
+
+def _content_key(q_type, text):
+    return 'sha256:' + hashlib.sha256(f'{q_type}\n{text}'.encode()).hexdigest()
+
+def source_key(q, occurrence=1):
+    """Stable identity of a bank question: its id, or a hash of its type and text when it has none.
+
+    Questions without an id that repeat the type and text of an earlier one
+    in the same test (e.g. several "Refer to the exhibit" questions) are
+    told apart by occurrence, their position among those repeats.
+    """
+    if q.get('id') is not None:
+        return str(q['id'])
+    key = _content_key(q['type'], q['text'])
+    return key if occurrence == 1 else f'{key}:{occurrence}'
+
+def question_row(q, image_map=None):
+    """Validate one question from a bank and build its Question column values.
+
+    image_map renames image references (ZIP images saved under a new name).
+
+    Returns:
+        tuple: (row dict, None) for a valid question, (None, reason) otherwise
+    """
+    if not isinstance(q, dict) or not isinstance(q.get('type'), str) or 'text' not in q:
+        return None, 'missing type or text'
+    if q['type'] == 'match':
+        if not (q.get('terms') and q.get('definitions') and q.get('correct_mappings')):
+            return None, 'match question without terms/definitions/mappings'
+        options = json.dumps({'terms': q.get('terms', []), 'definitions': q.get('definitions', [])})
+        correct = json.dumps(q.get('correct_mappings', {}))
+    else:
+        options = json.dumps(q.get('options', []))
+        correct = q.get('correct', '')
+    return {
+        'type': q['type'],
+        'text': q['text'],
+        'options': options,
+        'correct': correct,
+        'explanation': q.get('explanation', ''),
+        'image': _image_name(normalize_image_path(q.get('image')), image_map),
+        'source_key': source_key(q),
+    }, None
+
+def _image_name(image, image_map):
+    if not image or not image_map:
+        return image
+    return image_map.get(image, image)
+
+def clear_tests():
+    """Delete every test, question and derived per-question row (caller commits)."""
+    CardState.query.delete()
+    QuestionStats.query.delete()
+    Question.query.delete()
+    Test.query.delete()
+    # Restart IDs at 1, as a fresh database would
+    if db.session.execute(db.text("SELECT name FROM sqlite_master WHERE type='table' AND name='sqlite_sequence'")).first():
+        db.session.execute(db.text("DELETE FROM sqlite_sequence WHERE name IN ('test', 'question')"))
+
+# An overwrite import builds the new bank in these tables, then swaps it in
+_STAGING_PREFIX = 'staging_'
+
+def _create_staging():
+    """Create empty staging copies of the test and question tables, dropping any left by a crashed import.
+
+    The copies have the same columns and defaults but no foreign keys or
+    secondary indexes, so filling them is cheap and touches nothing live.
+
+    Returns:
+        tuple: (staging test table, staging question table)
+    """
+    metadata = db.MetaData()
+    tables = [
+        db.Table(_STAGING_PREFIX + table.name, metadata, *(
+            db.Column(c.name, c.type, primary_key=c.primary_key, default=c.default.arg if c.default is not None else None)
+            for c in table.columns
+        ))
+        for table in (Test.__table__, Question.__table__)
+    ]
+    connection = db.session.connection()
+    metadata.drop_all(connection)
+    metadata.create_all(connection)
+    db.session.commit()
+    return tuple(tables)
+
+def _drop_staging(tables):
+    db.session.rollback()
+    tables[0].metadata.drop_all(db.session.connection())
+    db.session.commit()
+
+def _swap_in(staging):
+    """Replace the live bank with the staged one (caller commits).
+
+    Staged IDs start at 1, as clear_tests would leave them, and are copied
+    as they are, so the swap is two INSERT ... SELECT statements inside
+    the transaction that clears the old bank.
+
+    Returns:
+        list: Images the old bank referenced, to release once committed
+    """
+    images = db.session.scalars(db.select(Question.image).where(Question.image.is_not(None)).distinct()).all()
+    clear_tests()
+    for live, staged in zip((Test.__table__, Question.__table__), staging):
+        columns = [c.name for c in staged.columns]
+        db.session.execute(db.insert(live).from_select(columns, db.select(staged)))
+    return images
+
+# Columns compared by a sync import to decide whether a question changed
+_SYNC_COLUMNS = ('type', 'text', 'options', 'correct', 'explanation', 'image', 'source_key')
+
+def _sync_questions(test_id, rows, retire, batch_size):
+    """Upsert one test's questions by source_key (caller commits).
+
+    Questions are matched by source_key first. Those left over on either
+    side (imported before source keys existed, or from a bank that gained
+    or lost its ids since) are then paired by type and text, repeated texts
+    in ID order, and take the bank's key on the way.
+
+    Returns:
+        tuple: (inserted, updated, unchanged, retired, images no longer used by updated or retired questions)
+    """
+    existing = db.session.execute(db.select(*(getattr(Question, c) for c in ('id',) + _SYNC_COLUMNS)).where(
+        Question.test_id == test_id
+    ).order_by(Question.id)).all()
+    by_key = {r.source_key: r for r in existing if r.source_key}
+    current_rows = [by_key.get(row['source_key']) for row in rows]
+    matched = {current.id for current in current_rows if current is not None}
+    by_content = {}
+    for r in existing:
+        if r.id not in matched:
+            by_content.setdefault(_content_key(r.type, r.text), []).append(r)
+    inserts, updates, released = [], [], []
+    for row, current in zip(rows, current_rows):
+        if current is None:
+            candidates = by_content.get(_content_key(row['type'], row['text']))
+            current = candidates.pop(0) if candidates else None
+        if current is None:
+            inserts.append(dict(row, test_id=test_id))
+            continue
+        matched.add(current.id)
+        if any(getattr(current, column) != row[column] for column in _SYNC_COLUMNS):
+            updates.append(dict(row, id=current.id))
+            if current.image != row['image']:
+                released.append(current.image)
+    retired = [r for r in existing if r.id not in matched] if retire else []
+    for start in range(0, len(inserts), batch_size):
+        db.session.execute(db.insert(Question), inserts[start:start + batch_size])
+    for start in range(0, len(updates), batch_size):
+        # Bulk UPDATE by primary key, one executemany per batch
+        db.session.execute(db.update(Question), updates[start:start + batch_size])
+    if retired:
+        retired_ids = [r.id for r in retired]
+        CardState.query.filter(CardState.question_id.in_(retired_ids)).delete(synchronize_session=False)
+        QuestionStats.query.filter(QuestionStats.question_id.in_(retired_ids)).delete(synchronize_session=False)
+        Question.query.filter(Question.id.in_(retired_ids)).delete(synchronize_session=False)
+        released.extend(r.image for r in retired)
+    unchanged = len(matched) - len(updates)
+    return len(inserts), len(updates), unchanged, len(retired), released
+
+def import_tests(tests, overwrite=False, batch_size=500, image_map=None, sync=False, retire=False):
+    """Import tests from an iterable of bank dicts in a single transaction.
+
+    Each test row is inserted with Core, and its valid questions follow as
+    Core executemany batches of batch_size rows (sent by SQLAlchemy as
+    multi-row INSERT ... VALUES statements). Invalid tests and
+    questions are skipped and reported. Any error rolls back the whole
+    import.
+
+    With overwrite, the new bank is built in staging tables instead,
+    committing after every batch so the write lock is never held for long,
+    and only swapped in for the old bank at the end, in one short
+    transaction. Until then readers see the old bank in full; if anything
+    fails, the staging tables are dropped and the old bank stays as it was.
+
+    With sync, a test whose name already exists is updated in place
+    instead: its questions are matched by source_key, only new questions
+    are inserted and only changed ones updated, so question IDs (and the
+    history, flashcard and statistics rows keyed by them) survive. With
+    retire as well, questions missing from the bank are deleted.
+
+    Returns:
+        ImportResult
+    """
+    started = time.perf_counter()
+    imported_tests = imported_questions = updated = unchanged = retired = 0
+    skipped = []
+    released = []
+    test_table, question_table = Test.__table__, Question.__table__
+    staging = None
+    if overwrite:
+        # Nothing to sync against: every test in the bank is new
+        sync = False
+        staging = test_table, question_table = _create_staging()
+    try:
+        for test_data in tests:
+            if not isinstance(test_data, dict) or 'test_name' not in test_data:
+                skipped.append((None, None, 'test without test_name'))
+                continue
+            name = test_data['test_name']
+            rows = []
+            keys = set()
+            occurrences = {}
+            for index, q in enumerate(test_data.get('questions') or []):
+                row, reason = question_row(q, image_map)
+                if row is not None and q.get('id') is None:
+                    occurrences[row['source_key']] = occurrence = occurrences.get(row['source_key'], 0) + 1
+                    row['source_key'] = source_key(q, occurrence)
+                elif row is not None and sync and row['source_key'] in keys:
+                    row, reason = None, f'duplicate id {row["source_key"]}'
+                if row is None:
+                    skipped.append((name, index, reason))
+                else:
+                    keys.add(row['source_key'])
+                    rows.append(row)
+            description = test_data.get('description', '')
+            existing = db.session.execute(db.select(Test.id, Test.description).where(Test.name == name).order_by(Test.id).limit(1)).first() if sync else None
+            if existing is not None:
+                test_id = existing.id
+                inserted, changed, same, removed, images = _sync_questions(test_id, rows, retire, batch_size)
+                released.extend(images)
+                if inserted or changed or removed or existing.description != description:
+                    db.session.execute(db.update(Test).where(Test.id == test_id).values(
+                        description=description,
+                        num_questions=db.select(db.func.count(Question.id)).where(Question.test_id == test_id).scalar_subquery(),
+                        revision=Test.revision + 1,
+                    ))
+                imported_questions += inserted
+                updated += changed
+                unchanged += same
+                retired += removed
+                imported_tests += 1
+                continue
+            test_id = db.session.execute(db.insert(test_table).values(
+                name=name,
+                description=description,
+                num_questions=len(rows),
+            )).inserted_primary_key[0]
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                for row in batch:
+                    row['test_id'] = test_id
+                db.session.execute(db.insert(question_table), batch)
+                if staging:
+                    db.session.commit()
+            imported_tests += 1
+            imported_questions += len(rows)
+        if staging:
+            swap_started = time.perf_counter()
+            released.extend(_swap_in(staging))
+            db.session.commit()
+            logger.info(f'Swapped in the staged bank in {(time.perf_counter() - swap_started) * 1000:.0f}ms')
+        else:
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if staging:
+            _drop_staging(staging)
+        invalidate_answer_key()
+    release_images(released)
+    elapsed = time.perf_counter() - started
+    for test_name, index, reason in skipped[:20]:
+        logger.warning(f'Skipped question {index} of test "{test_name}": {reason}' if index is not None else f'Skipped test: {reason}')
+    logger.info(f'Imported {imported_tests} tests, {imported_questions} questions in {elapsed:.2f}s '
+                f'({imported_questions / elapsed if elapsed else 0:.0f} questions/s), {len(skipped)} skipped'
+                + (f'; {updated} updated, {unchanged} unchanged, {retired} retired' if sync else ''))
+    return ImportResult(imported_tests, imported_questions, skipped, elapsed,
+                        updated=updated, unchanged=unchanged, retired=retired)
+
+def import_zip(zip_file, overwrite=False, batch_size=500, sync=False, retire=False):
+    """Import a ZIP bank: stream its images into the image store, then import its tests.
+
+    Images already in the image store (from an earlier import, an upload or
+    an export of this bank) are not written again. test_data.json is then
+    decoded straight from the archive with iter_json_tests, one test at a
+    time. Variants of new images are generated in the background once the
+    import has committed.
+
+    Returns:
+        ImportResult, with images and image_errors filled in
+    """
+    with zipfile.ZipFile(zip_file, 'r') as archive:
+        received, image_errors = extract_zip_images(archive)
+        try:
+            saved_images, new_images = store_images(received)
+        except Exception:
+            db.session.rollback()
+            raise
+        with archive.open('test_data.json') as json_file:
+            result = import_tests(iter_json_tests(json_file), overwrite=overwrite, batch_size=batch_size,
+                                  image_map=saved_images, sync=sync, retire=retire)
+    image_processor.submit(new_images)
+    return result._replace(images=len(saved_images), image_errors=image_errors)
@@ -0,0 +1,186 @@
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from extensions import db
+from models import Question, QuestionStats
+from grading import build_answer_key, grade_answers, iter_history_batches, rescore_history
+import json
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+_SUM_COLUMNS = ('attempts', 'correct', 'score_sum', 'time_sum', 'timed_attempts',
+                'exam_attempts', 'exam_score_sum', 'exam_score_sq_sum',
+                'exam_total_sum', 'exam_total_sq_sum', 'exam_cross_sum')
+# Sums a rebuild recomputes from History; it carries no timing, so time_sum and timed_attempts are kept
+_REPLAYED_COLUMNS = tuple(column for column in _SUM_COLUMNS if column not in ('time_sum', 'timed_attempts'))
+
+def item_deltas(test_id, item_scores, exam=False, elapsed=None):
+    """Turn one graded attempt into per-question increments of the QuestionStats sums.
+
+    Args:
+        test_id: Test the questions belong to
+        item_scores: Dict mapping question IDs to scores (0..1)
+        exam: True for a simulation attempt, which also feeds discrimination
+        elapsed: Seconds the attempt took, spread evenly over its questions
+    """
+    total = sum(item_scores.values())
+    per_item_time = elapsed / len(item_scores) if elapsed and item_scores else None
+    deltas = []
+    for q_id, score in item_scores.items():
+        delta = dict.fromkeys(_SUM_COLUMNS, 0)
+        delta.update(question_id=q_id, test_id=test_id, attempts=1,
+                     correct=1 if score == 1 else 0, score_sum=score)
+        if per_item_time is not None:
+            delta.update(time_sum=per_item_time, timed_attempts=1)
+        if exam:
+            delta.update(exam_attempts=1, exam_score_sum=score, exam_score_sq_sum=score * score,
+                         exam_total_sum=total, exam_total_sq_sum=total * total, exam_cross_sum=score * total)
+        deltas.append(delta)
+    return deltas
+
+def merge_deltas(deltas):
+    """Sum deltas per question so each question is upserted once."""
+    merged = {}
+    for delta in deltas:
+        current = merged.get(delta['question_id'])
+        if current is None:
+            merged[delta['question_id']] = dict(delta)
+        else:
+            for column in _SUM_COLUMNS:
+                current[column] += delta[column]
+    return list(merged.values())
+
+def apply_deltas(deltas):
+    """Add deltas to QuestionStats with one executemany upsert; the caller commits."""
+    if not deltas:
+        return
+    stmt = sqlite_insert(QuestionStats)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[QuestionStats.question_id],
+        set_={column: getattr(QuestionStats, column) + getattr(stmt.excluded, column) for column in _SUM_COLUMNS},
+    )
+    db.session.execute(stmt, merge_deltas(deltas))
+
+def record_attempt(test_id, item_scores, exam=False, elapsed=None):
+    """Fold one graded attempt into the running item statistics."""
+    apply_deltas(item_deltas(test_id, item_scores, exam=exam, elapsed=elapsed))
+
+def _discrimination(stats):
+    """Item-rest point-biserial correlation over simulation attempts (None if undefined)."""
+    n = stats.exam_attempts
+    if n < 2:
+        return None
+    sum_x, sum_xx = stats.exam_score_sum, stats.exam_score_sq_sum
+    # Rest score r = t - x, so the item does not correlate with itself
+    sum_r = stats.exam_total_sum - sum_x
+    sum_rr = stats.exam_total_sq_sum - 2 * stats.exam_cross_sum + sum_xx
+    sum_xr = stats.exam_cross_sum - sum_xx
+    var_x = n * sum_xx - sum_x * sum_x
+    var_r = n * sum_rr - sum_r * sum_r
+    if var_x <= 1e-9 or var_r <= 1e-9:
+        return None
+    return (n * sum_xr - sum_x * sum_r) / math.sqrt(var_x * var_r)
+
+def item_analysis_query(test_id):
+    """Query for each question of a test with its QuestionStats row (None before any attempt)."""
+    return db.session.query(Question.id, Question.text, Question.type, QuestionStats).outerjoin(
+        QuestionStats, QuestionStats.question_id == Question.id
+    ).filter(Question.test_id == test_id).order_by(Question.id)
+
+def item_analysis(test_id):
+    """Per-question difficulty and discrimination for a test, one row per question.
+
+    Returns:
+        list: Dicts with question, attempts, p_value (mean score), correct_rate,
+        discrimination and avg_time (seconds); statistics are None without data
+    """
+    rows = item_analysis_query(test_id).all()
+    analysis = []
+    for q_id, text, q_type, stats in rows:
+        attempts = stats.attempts if stats else 0
+        analysis.append({
+            'question_id': q_id,
+            'text': text,
+            'type': q_type,
+            'attempts': attempts,
+            'p_value': stats.score_sum / attempts if attempts else None,
+            'correct_rate': stats.correct / attempts if attempts else None,
+            'discrimination': _discrimination(stats) if stats else None,
+            'exam_attempts': stats.exam_attempts if stats else 0,
+            'avg_time': stats.time_sum / stats.timed_attempts if stats and stats.timed_attempts else None,
+        })
+    return analysis
+
+def _replay(test_id, answer_key, batches):
+    """Regrade History batches into merged QuestionStats deltas.
+
+    Returns:
+        tuple: (deltas, rows scanned, last History ID read or None)
+    """
+    deltas = []
+    scanned = 0
+    last_id = None
+    for rows in batches:
+        for row_id, mode, answers in rows:
+            try:
+                item_scores = grade_answers(mode, json.loads(answers or '{}'), answer_key)
+            except json.JSONDecodeError:
+                logger.warning(f'Skipping History ID {row_id} with invalid answers JSON')
+                continue
+            if item_scores:
+                deltas.extend(item_deltas(test_id, item_scores, exam=mode == 'sim'))
+        # Keep memory at O(questions) rather than O(history)
+        deltas = merge_deltas(deltas)
+        scanned += len(rows)
+        last_id = rows[-1][0]
+    return deltas, scanned, last_id
+
+def backfill_item_stats(test_id, batch_size=1000):
+    """Rebuild a test's item statistics from its stored History rows.
+
+    History is replayed with grading.iter_history_batches and regraded
+    against the current answer key, without holding the write lock. The
+    rebuilt sums then replace the stored ones in one transaction, which
+    first takes the write lock and replays the rows committed since the
+    scan; every History row commits together with its live increment, so
+    none is lost. History does not record time per attempt, so the timing
+    sums are kept as they are. Simulation rows only store answered
+    questions, so skipped questions are not counted.
+
+    Returns:
+        tuple: (rows_scanned, questions_updated)
+    """
+    answer_key = build_answer_key(test_id)
+    columns = ('mode', 'answers')
+    deltas, scanned, last_id = _replay(test_id, answer_key, iter_history_batches(test_id, columns, batch_size))
+    try:
+        # The UPDATE takes the write lock, so nothing commits between the tail replay and the upsert
+        QuestionStats.query.filter_by(test_id=test_id).update(
+            dict.fromkeys(_REPLAYED_COLUMNS, 0), synchronize_session=False
+        )
+        tail, tail_scanned, _ = _replay(test_id, answer_key, iter_history_batches(test_id, columns, batch_size, after=last_id or 0))
+        deltas = merge_deltas(deltas + tail)
+        if deltas:
+            stmt = sqlite_insert(QuestionStats)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[QuestionStats.question_id],
+                set_={column: getattr(stmt.excluded, column) for column in _REPLAYED_COLUMNS},
+            )
+            db.session.execute(stmt, deltas)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    scanned += tail_scanned
+    logger.info(f'Backfilled item statistics for test ID {test_id}: {len(deltas)} questions from {scanned} attempts')
+    return scanned, len(deltas)
+
+def rescore_attempts(test_id, batch_size=1000):
+    """Re-grade a test's stored attempts and rebuild its item statistics to match.
+
+    Returns:
+        tuple: (rows_scanned, rows_updated)
+    """
+    scanned, updated = rescore_history(test_id, batch_size=batch_size)
+    backfill_item_stats(test_id, batch_size=batch_size)
+    return scanned, updated
@@ -0,0 +1,31 @@
+"""drop image blob source digest
+
+Revision ID: 06e70ff9277d
+Revises: 5c525a7de983
+Create Date: 2026-10-18 05:20:11.482913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '06e70ff9277d'
+down_revision = '5c525a7de983'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('image_blob', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_image_blob_source_digest'))
+        batch_op.drop_column('source_digest')
+
+
+def downgrade():
+    with op.batch_alter_table('image_blob', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('source_digest', sa.String(length=64), nullable=True))
+    op.execute('UPDATE image_blob SET source_digest = digest')
+    with op.batch_alter_table('image_blob', schema=None) as batch_op:
+        batch_op.alter_column('source_digest', existing_type=sa.String(length=64), nullable=False)
+        batch_op.create_index(batch_op.f('ix_image_blob_source_digest'), ['source_digest'], unique=False)
@@ -0,0 +1,34 @@
+"""index foreign keys on hot queries
+
+Revision ID: 071f193af5b7
+Revises: 11b3512972dc
+Create Date: 2026-10-18 02:25:54.244002
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '071f193af5b7'
+down_revision = '11b3512972dc'
+branch_labels = None
+depends_on = None
+
+# History.user_id is served by the leading column of ix_history_user_date
+INDEXES = [
+    ('question', 'ix_question_test_id', ['test_id']),
+    ('history', 'ix_history_test_id', ['test_id']),
+]
+
+
+def upgrade():
+    for table, name, columns in INDEXES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_index(name, columns, unique=False)
+
+
+def downgrade():
+    for table, name, columns in reversed(INDEXES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(name)
@@ -0,0 +1,26 @@
+"""track image variant processing
+
+Revision ID: 07dd858847de
+Revises: 3d4241064abf
+Create Date: 2026-10-18 03:41:27.905114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '07dd858847de'
+down_revision = '3d4241064abf'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('image_blob', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('processed', sa.Boolean(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('image_blob', schema=None) as batch_op:
+        batch_op.drop_column('processed')
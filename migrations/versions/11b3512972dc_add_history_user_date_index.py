@@ -0,0 +1,26 @@
+"""add history user date index
+
+Revision ID: 11b3512972dc
+Revises: 1d1369cfdf42
+Create Date: 2026-10-18 02:24:49.314785
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '11b3512972dc'
+down_revision = '1d1369cfdf42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('history', schema=None) as batch_op:
+        batch_op.create_index('ix_history_user_date', ['user_id', sa.text('date DESC'), sa.text('id DESC')], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('history', schema=None) as batch_op:
+        batch_op.drop_index('ix_history_user_date')
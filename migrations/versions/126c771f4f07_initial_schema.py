@@ -0,0 +1,67 @@
+"""initial schema
+
+Revision ID: 126c771f4f07
+Revises: 
+Create Date: 2026-10-18 09:12:41.305118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '126c771f4f07'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=64), nullable=True),
+        sa.Column('password_hash', sa.String(length=128), nullable=True),
+        sa.Column('role', sa.String(length=20), nullable=True),
+        sa.Column('is_admin', sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('username')
+    )
+    op.create_table('test',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('time_limit', sa.Integer(), nullable=True),
+        sa.Column('num_questions', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('question',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('test_id', sa.Integer(), nullable=True),
+        sa.Column('type', sa.String(length=50), nullable=False),
+        sa.Column('text', sa.Text(), nullable=True),
+        sa.Column('options', sa.Text(), nullable=True),
+        sa.Column('correct', sa.Text(), nullable=True),
+        sa.Column('explanation', sa.Text(), nullable=True),
+        sa.Column('image', sa.String(length=255), nullable=True),
+        sa.ForeignKeyConstraint(['test_id'], ['test.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('history',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('test_id', sa.Integer(), nullable=True),
+        sa.Column('mode', sa.String(length=20), nullable=True),
+        sa.Column('score', sa.Float(), nullable=True),
+        sa.Column('answers', sa.Text(), nullable=True),
+        sa.Column('date', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['test_id'], ['test.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('history')
+    op.drop_table('question')
+    op.drop_table('test')
+    op.drop_table('user')
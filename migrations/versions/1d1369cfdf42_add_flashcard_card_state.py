@@ -0,0 +1,41 @@
+"""add flashcard card state
+
+Revision ID: 1d1369cfdf42
+Revises: 800395cb2d0b
+Create Date: 2026-10-18 12:21:50.442907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1d1369cfdf42'
+down_revision = '800395cb2d0b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('card_state',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('question_id', sa.Integer(), nullable=False),
+        sa.Column('test_id', sa.Integer(), nullable=True),
+        sa.Column('easiness', sa.Float(), nullable=True),
+        sa.Column('interval', sa.Integer(), nullable=True),
+        sa.Column('repetitions', sa.Integer(), nullable=True),
+        sa.Column('due_at', sa.DateTime(), nullable=True),
+        sa.Column('last_reviewed', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['question_id'], ['question.id'], ),
+        sa.ForeignKeyConstraint(['test_id'], ['test.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'question_id')
+    )
+    with op.batch_alter_table('card_state', schema=None) as batch_op:
+        batch_op.create_index('ix_card_state_user_due', ['user_id', 'test_id', 'due_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('card_state', schema=None) as batch_op:
+        batch_op.drop_index('ix_card_state_user_due')
+    op.drop_table('card_state')
@@ -0,0 +1,41 @@
+"""add content-addressed image blobs
+
+Revision ID: 3d4241064abf
+Revises: 8eba254ed60f
+Create Date: 2026-10-18 03:05:12.418230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d4241064abf'
+down_revision = '8eba254ed60f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('image_blob',
+        sa.Column('name', sa.String(length=80), nullable=False),
+        sa.Column('digest', sa.String(length=64), nullable=False),
+        sa.Column('source_digest', sa.String(length=64), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('created', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+    with op.batch_alter_table('image_blob', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_image_blob_digest'), ['digest'], unique=True)
+        batch_op.create_index(batch_op.f('ix_image_blob_source_digest'), ['source_digest'], unique=False)
+    with op.batch_alter_table('question', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_question_image'), ['image'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('question', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_question_image'))
+    with op.batch_alter_table('image_blob', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_image_blob_source_digest'))
+        batch_op.drop_index(batch_op.f('ix_image_blob_digest'))
+    op.drop_table('image_blob')
@@ -0,0 +1,28 @@
+"""make image blob digest a unique constraint
+
+Revision ID: 582f483537ff
+Revises: 06e70ff9277d
+Create Date: 2026-10-18 06:12:40.317526
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '582f483537ff'
+down_revision = '06e70ff9277d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('image_blob', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_image_blob_digest'))
+        batch_op.create_unique_constraint('uq_image_blob_digest', ['digest'])
+
+
+def downgrade():
+    with op.batch_alter_table('image_blob', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_image_blob_digest', type_='unique')
+        batch_op.create_index(batch_op.f('ix_image_blob_digest'), ['digest'], unique=True)
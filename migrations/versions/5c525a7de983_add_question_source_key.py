@@ -0,0 +1,28 @@
+"""add question source key
+
+Revision ID: 5c525a7de983
+Revises: 07dd858847de
+Create Date: 2026-10-18 04:12:50.337615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c525a7de983'
+down_revision = '07dd858847de'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('question', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('source_key', sa.String(length=80), nullable=True))
+        batch_op.create_index('ix_question_test_source', ['test_id', 'source_key'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('question', schema=None) as batch_op:
+        batch_op.drop_index('ix_question_test_source')
+        batch_op.drop_column('source_key')
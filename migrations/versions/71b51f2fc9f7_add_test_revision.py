@@ -0,0 +1,26 @@
+"""add test revision
+
+Revision ID: 71b51f2fc9f7
+Revises: 126c771f4f07
+Create Date: 2026-10-18 09:40:03.671920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '71b51f2fc9f7'
+down_revision = '126c771f4f07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('test', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('test', schema=None) as batch_op:
+        batch_op.drop_column('revision')
@@ -0,0 +1,50 @@
+"""add simulation session store
+
+Revision ID: 800395cb2d0b
+Revises: 71b51f2fc9f7
+Create Date: 2026-10-18 11:05:27.118402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '800395cb2d0b'
+down_revision = '71b51f2fc9f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sim_session',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('token', sa.String(length=64), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('test_id', sa.Integer(), nullable=True),
+        sa.Column('current', sa.Integer(), nullable=True),
+        sa.Column('start_time', sa.Float(), nullable=True),
+        sa.Column('time_limit', sa.Integer(), nullable=True),
+        sa.Column('questions', sa.Text(), nullable=True),
+        sa.Column('created', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['test_id'], ['test.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('token')
+    )
+    with op.batch_alter_table('sim_session', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_sim_session_user_id'), ['user_id'], unique=False)
+    op.create_table('sim_answer',
+        sa.Column('sim_session_id', sa.Integer(), nullable=False),
+        sa.Column('question_id', sa.Integer(), nullable=False),
+        sa.Column('answer', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['sim_session_id'], ['sim_session.id'], ),
+        sa.PrimaryKeyConstraint('sim_session_id', 'question_id')
+    )
+
+
+def downgrade():
+    op.drop_table('sim_answer')
+    with op.batch_alter_table('sim_session', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sim_session_user_id'))
+    op.drop_table('sim_session')
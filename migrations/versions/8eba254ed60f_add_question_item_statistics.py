@@ -0,0 +1,45 @@
+"""add question item statistics
+
+Revision ID: 8eba254ed60f
+Revises: 071f193af5b7
+Create Date: 2026-10-18 02:28:33.540949
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8eba254ed60f'
+down_revision = '071f193af5b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('question_stats',
+        sa.Column('question_id', sa.Integer(), nullable=False),
+        sa.Column('test_id', sa.Integer(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('correct', sa.Integer(), nullable=False),
+        sa.Column('score_sum', sa.Float(), nullable=False),
+        sa.Column('time_sum', sa.Float(), nullable=False),
+        sa.Column('timed_attempts', sa.Integer(), nullable=False),
+        sa.Column('exam_attempts', sa.Integer(), nullable=False),
+        sa.Column('exam_score_sum', sa.Float(), nullable=False),
+        sa.Column('exam_score_sq_sum', sa.Float(), nullable=False),
+        sa.Column('exam_total_sum', sa.Float(), nullable=False),
+        sa.Column('exam_total_sq_sum', sa.Float(), nullable=False),
+        sa.Column('exam_cross_sum', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['question_id'], ['question.id'], ),
+        sa.ForeignKeyConstraint(['test_id'], ['test.id'], ),
+        sa.PrimaryKeyConstraint('question_id')
+    )
+    with op.batch_alter_table('question_stats', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_question_stats_test_id'), ['test_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('question_stats', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_question_stats_test_id'))
+    op.drop_table('question_stats')
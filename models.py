@@ -1,4 +1,5 @@
 from datetime import datetime
+import time
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from extensions import db
@@ -16,17 +17,23 @@ class User(db.Model, UserMixin):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+def _initial_revision():
+    # Seeded from the clock rather than 0 so a test ID reused after a delete
+    # never matches cache entries left over from the old test.
+    return int(time.time() * 1000)
+
 class Test(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     time_limit = db.Column(db.Integer)
     num_questions = db.Column(db.Integer)
+    revision = db.Column(db.Integer, nullable=False, default=_initial_revision, server_default='0')  # Bumped on every content change; keys compiled/rendered caches
     questions = db.relationship('Question', backref='test', lazy=True, cascade="all, delete-orphan")
 
 class Question(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    test_id = db.Column(db.Integer, db.ForeignKey('test.id'))
+    test_id = db.Column(db.Integer, db.ForeignKey('test.id'), index=True)
     type = db.Column(db.String(50), nullable=False)  # e.g., 'multiple_choice', 'true_false', 'flashcard', 'match'
     text = db.Column(db.Text)  # Question text or description
     options = db.Column(db.Text)  # JSON string for options
@@ -38,16 +45,82 @@ class Question(db.Model):
     # For true_false: "True"
     # For match: {"1": "1", "2": "2"} (term_id: definition_id)
     explanation = db.Column(db.Text)  # Feedback for study mode
-    image = db.Column(db.String(255))  # Path to topology screenshot (nullable)
+    image = db.Column(db.String(255), index=True)  # Topology screenshot: ImageBlob name, or a legacy upload name (nullable)
+    source_key = db.Column(db.String(80))  # Stable identity in the imported bank: its question id, or "sha256:<hash>" of type and text
+
+    __table_args__ = (
+        # Delta imports match a test's questions by source_key
+        db.Index('ix_question_test_source', test_id, source_key),
+    )
 
 class History(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    test_id = db.Column(db.Integer, db.ForeignKey('test.id'))
+    test_id = db.Column(db.Integer, db.ForeignKey('test.id'), index=True)
     mode = db.Column(db.String(20))  # e.g., 'study', 'test'
     score = db.Column(db.Float)  # Changed to Float for fractional scores (e.g., 0.75)
     answers = db.Column(db.Text)  # JSON of user answers
     # For multiple_choice: {"question_id": "answer"}
     # For match: {"term_id": "definition_id"}
     date = db.Column(db.DateTime, default=datetime.utcnow)
-    test = db.relationship('Test', backref='histories', lazy=True)
\ No newline at end of file
+    test = db.relationship('Test', backref='histories', lazy=True)
+
+    __table_args__ = (
+        # Newest-first history page; id breaks ties in the (date, id) keyset
+        db.Index('ix_history_user_date', user_id, date.desc(), id.desc()),
+    )
+
+class SimSession(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(64), unique=True, nullable=False)  # Opaque ID held in the session cookie
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    test_id = db.Column(db.Integer, db.ForeignKey('test.id'))
+    current = db.Column(db.Integer, default=0)  # Index into questions
+    start_time = db.Column(db.Float)  # Unix timestamp
+    time_limit = db.Column(db.Integer, default=0)  # Seconds, 0 for unlimited
+    questions = db.Column(db.Text)  # JSON list of selected question IDs, in exam order
+    created = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SimAnswer(db.Model):
+    sim_session_id = db.Column(db.Integer, db.ForeignKey('sim_session.id'), primary_key=True)
+    question_id = db.Column(db.Integer, primary_key=True)
+    answer = db.Column(db.Text)  # JSON of the user's answer (str, list for mrq, {term_id: definition_id} for match)
+
+class CardState(db.Model):
+    # Spaced-repetition (SM-2) state of one flashcard for one user
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), primary_key=True)
+    test_id = db.Column(db.Integer, db.ForeignKey('test.id'))
+    easiness = db.Column(db.Float, default=2.5)  # SM-2 easiness factor, never below 1.3
+    interval = db.Column(db.Integer, default=0)  # Days until the next review
+    repetitions = db.Column(db.Integer, default=0)  # Consecutive successful reviews
+    due_at = db.Column(db.DateTime)
+    last_reviewed = db.Column(db.DateTime)
+    __table_args__ = (
+        db.Index('ix_card_state_user_due', 'user_id', 'test_id', 'due_at'),
+    )
+
+class QuestionStats(db.Model):
+    # Running item-analysis sums for one question, maintained as attempts are graded
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), primary_key=True)
+    test_id = db.Column(db.Integer, db.ForeignKey('test.id'), index=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)  # Graded answers, study and sim
+    correct = db.Column(db.Integer, default=0, nullable=False)  # Answers with full credit
+    score_sum = db.Column(db.Float, default=0, nullable=False)  # Sum of scores, partial match credit included
+    time_sum = db.Column(db.Float, default=0, nullable=False)  # Seconds spent, over timed_attempts
+    timed_attempts = db.Column(db.Integer, default=0, nullable=False)
+    # Sums over simulation attempts only (x = item score, t = attempt total), for item-rest discrimination
+    exam_attempts = db.Column(db.Integer, default=0, nullable=False)
+    exam_score_sum = db.Column(db.Float, default=0, nullable=False)  # sum(x)
+    exam_score_sq_sum = db.Column(db.Float, default=0, nullable=False)  # sum(x^2)
+    exam_total_sum = db.Column(db.Float, default=0, nullable=False)  # sum(t)
+    exam_total_sq_sum = db.Column(db.Float, default=0, nullable=False)  # sum(t^2)
+    exam_cross_sum = db.Column(db.Float, default=0, nullable=False)  # sum(x*t)
+
+class ImageBlob(db.Model):
+    # One stored original image, named after the SHA-256 of its bytes; Question.image refers to it by name
+    name = db.Column(db.String(80), primary_key=True)  # "<digest><ext>", the file name in UPLOAD_FOLDER
+    digest = db.Column(db.String(64), unique=True, nullable=False)  # SHA-256 of the stored bytes
+    size = db.Column(db.Integer, nullable=False)  # Bytes on disk, original only
+    processed = db.Column(db.Boolean, default=False, nullable=False, server_default='0')  # Variants generated (or attempted), see images.VARIANTS
+    created = db.Column(db.DateTime, default=datetime.utcnow)
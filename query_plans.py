@@ -0,0 +1,73 @@
+from datetime import datetime
+from extensions import db
+from auth import user_by_name_query
+from user import (test_catalogue_query, question_chunk_query, question_count_query, question_ids_query,
+                  history_page_query, history_review_query)
+from utils import question_counts_query
+from grading import answer_key_query, history_batch_query
+from item_stats import item_analysis_query
+from scheduler import due_cards_query, new_cards_query, due_counts_query
+from simulations import simulation_query, sim_answers_query
+import re
+
+# A full scan in SQLite's EXPLAIN QUERY PLAN output: of the table ("SCAN t", or "SCAN TABLE t" before
+# 3.36), of a whole index ("SCAN t USING [COVERING] INDEX i"), or an open-ended rowid range, which
+# walks the table from a point to its end ("SEARCH t USING INTEGER PRIMARY KEY (rowid>?)")
+_SCAN = re.compile(r'^(?:SCAN (?:TABLE )?(\w+).*|SEARCH (?:TABLE )?(\w+) USING INTEGER PRIMARY KEY \(rowid[<>]=?\?\))$')
+
+def hot_queries():
+    """The per-request queries the blueprints issue, as (name, statement, expected scans).
+
+    Statements come from the same query builders the routes and helpers
+    call, with sample arguments; bound values are irrelevant to the plan.
+    Expected scans are SCAN line prefixes for queries that read a whole
+    table by design (the test catalogue, the per-test question counts,
+    which must stay on a covering index); any other SCAN is a missing or
+    unused index.
+    """
+    now = datetime.utcnow()
+    return [
+        ('login user', user_by_name_query('admin'), ()),
+        ('test catalogue', test_catalogue_query(), ('SCAN test',)),
+        ('question counts', question_counts_query(), ('SCAN question USING COVERING INDEX',)),
+        ('question chunk', question_chunk_query(1, 0, 51), ()),
+        ('question count', question_count_query(1), ()),
+        ('chunk position', question_count_query(1, through=50), ()),
+        ('answer key', answer_key_query(1), ()),
+        ('sim question ids', question_ids_query(1), ()),
+        ('history page', history_page_query(1, None, 26), ()),
+        ('older history page', history_page_query(1, (now, 0), 26), ()),
+        ('history review', history_review_query(1, 1), ()),
+        ('item analysis', item_analysis_query(1), ()),
+        ('rescore batch', history_batch_query(1, ('mode', 'score', 'answers'), 1000), ()),
+        ('due cards', due_cards_query(1, 1, 100, now), ()),
+        ('new cards', new_cards_query(1, 1, 20), ()),
+        ('due counts', due_counts_query(1, now), ()),
+        ('sim session', simulation_query('x', 1), ()),
+        ('sim answers', sim_answers_query(1), ()),
+    ]
+
+def explain(statement):
+    """Return the EXPLAIN QUERY PLAN detail lines for a Core statement or ORM query."""
+    compiled = getattr(statement, 'statement', statement).compile(dialect=db.engine.dialect)
+    params = tuple(None for _ in compiled.positiontup or ())
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params).all()
+    return [row[-1] for row in rows]
+
+def find_full_scans():
+    """Check every hot query for full table and index scans.
+
+    Returns:
+        list: (name, plan lines, unexpected scans) for each query, unexpected scans empty when it uses indexes
+    """
+    results = []
+    for name, statement, expected in hot_queries():
+        plan = explain(statement)
+        scans = []
+        for line in plan:
+            line = line.strip().replace('SCAN TABLE ', 'SCAN ')
+            if _SCAN.match(line) and not any(line.startswith(prefix) for prefix in expected):
+                scans.append(line)
+        results.append((name, plan, scans))
+    return results
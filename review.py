@@ -0,0 +1,118 @@
+from models import Question
+from grading import compile_question, grade_answer
+from cache import LRUCache
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Review models of finished simulations, keyed by (history_id, test revision).
+# Sim attempts never change after submission, so only a question edit
+# (which bumps the revision) makes an entry stale.
+_sim_reviews = LRUCache(maxsize=1024)
+
+def _question_view(question):
+    """Decode a question once into what the review table needs."""
+    view = {
+        'id': question.id,
+        'type': question.type,
+        'text': question.text,
+        'image': question.image,
+        'compiled': compile_question(question.type, question.correct),
+        'correct': question.correct,
+    }
+    if question.type == 'match':
+        try:
+            options = json.loads(question.options or '{}')
+        except json.JSONDecodeError:
+            options = {}
+        view['terms'] = options.get('terms', [])
+        # Definition IDs arrive as ints or strings depending on the import; key by string
+        view['definitions'] = {str(d.get('id')): d.get('text') for d in options.get('definitions', [])}
+        view['correct'] = _match_lines(view, view['compiled'].correct)
+    return view
+
+def _match_lines(view, mappings):
+    mappings = mappings if isinstance(mappings, dict) else {}
+    lines = []
+    for term in view['terms']:
+        def_id = mappings.get(str(term.get('id')))
+        lines.append(f"{term.get('text')}: {view['definitions'].get(str(def_id), 'None') if def_id else 'None'}")
+    return lines
+
+def _review_item(view, mode, q_id, user_ans):
+    if mode == 'study' and view['type'] != 'match':
+        # Study rows wrap the answer as {question_id: {question_id: answer}}
+        user_ans = user_ans.get(str(q_id)) if isinstance(user_ans, dict) else user_ans
+    if view['type'] == 'match':
+        user_display = _match_lines(view, user_ans)
+    elif isinstance(user_ans, list):
+        user_display = ', '.join(str(a) for a in user_ans)
+    else:
+        user_display = user_ans if user_ans is not None else ''
+    if mode == 'flashcard' or not user_ans:
+        status = ''
+    else:
+        status = 'correct' if grade_answer(view['compiled'], user_ans) == 1 else 'incorrect'
+    return {
+        'question_id': q_id,
+        'found': True,
+        'text': view['text'],
+        'image': view['image'],
+        'type': view['type'],
+        'user_answer': user_display,
+        'correct_answer': view['correct'],
+        'status': status,
+    }
+
+def build_reviews(histories, revisions):
+    """Build per-attempt review models for a list of History rows.
+
+    Each answers blob is decoded once, every referenced question is loaded
+    with a single IN query and decoded once per request, and finished
+    simulations are served from the review cache.
+
+    Args:
+        histories: History rows to review
+        revisions: Dict mapping test IDs to their current revision
+
+    Returns:
+        dict: History ID -> list of review items
+    """
+    reviews = {}
+    pending = []
+    question_ids = set()
+    for history in histories:
+        key = (history.id, revisions.get(history.test_id))
+        if history.mode == 'sim':
+            cached = _sim_reviews.get(key)
+            if cached is not None:
+                reviews[history.id] = cached
+                continue
+        try:
+            answers = json.loads(history.answers or '{}')
+        except json.JSONDecodeError:
+            logger.warning(f'Invalid answers JSON in History ID {history.id}')
+            answers = {}
+        if not isinstance(answers, dict):
+            answers = {}
+        pending.append((history, key, answers))
+        question_ids.update(int(q_id) for q_id in answers if str(q_id).isdigit())
+
+    views = {}
+    if question_ids:
+        for question in Question.query.filter(Question.id.in_(question_ids)).all():
+            views[question.id] = _question_view(question)
+
+    for history, key, answers in pending:
+        items = []
+        for q_id, user_ans in answers.items():
+            view = views.get(int(q_id)) if str(q_id).isdigit() else None
+            if view is None:
+                items.append({'question_id': q_id, 'found': False})
+                continue
+            items.append(_review_item(view, history.mode, q_id, user_ans))
+        reviews[history.id] = items
+        if history.mode == 'sim':
+            _sim_reviews.set(key, items)
+    return reviews
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+from extensions import db
+from models import CardState, Question
+
+# Review grades offered in flashcard mode (SM-2 quality, 0-5)
+QUALITY_AGAIN = 1
+QUALITY_HARD = 3
+QUALITY_GOOD = 4
+QUALITY_EASY = 5
+
+def sm2(easiness, interval, repetitions, quality):
+    """Apply one SM-2 review. Returns (easiness, interval_days, repetitions)."""
+    if quality < 3:
+        repetitions = 0
+        interval = 1
+    else:
+        if repetitions == 0:
+            interval = 1
+        elif repetitions == 1:
+            interval = 6
+        else:
+            interval = max(1, round(interval * easiness))
+        repetitions += 1
+    easiness = max(1.3, easiness + (0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)))
+    return easiness, interval, repetitions
+
+# SM-2 state of a card that has never been reviewed
+_NEW_CARD = (2.5, 0, 0)
+
+def review_card(user_id, test_id, question_id, quality, now=None):
+    """Record a flashcard review and reschedule the card (caller commits)."""
+    now = now or datetime.utcnow()
+    state = db.session.get(CardState, (user_id, question_id))
+    if state is None:
+        easiness, interval, repetitions = _NEW_CARD
+        state = CardState(user_id=user_id, question_id=question_id, test_id=test_id,
+                          easiness=easiness, interval=interval, repetitions=repetitions)
+        db.session.add(state)
+    state.easiness, state.interval, state.repetitions = sm2(state.easiness, state.interval, state.repetitions, quality)
+    state.last_reviewed = now
+    state.due_at = now + timedelta(days=state.interval)
+    return state
+
+def preview_review(user_id, question_id, quality, now=None):
+    """Schedule a review would give a card, without changing it.
+
+    Returns:
+        tuple: (interval in days, due datetime)
+    """
+    now = now or datetime.utcnow()
+    state = db.session.get(CardState, (user_id, question_id))
+    current = (state.easiness, state.interval, state.repetitions) if state is not None else _NEW_CARD
+    _, interval, _ = sm2(*current, quality)
+    return interval, now + timedelta(days=interval)
+
+def apply_reviews(reviews):
+    """Apply queued flashcard reviews in order; the caller commits.
+
+    reviews: (user_id, test_id, question_id, quality, reviewed_at) tuples
+    """
+    for user_id, test_id, question_id, quality, reviewed_at in reviews:
+        review_card(user_id, test_id, question_id, quality, now=reviewed_at)
+        # Later reviews of the same card in this batch read the updated state
+        db.session.flush()
+
+def due_cards_query(user_id, test_id, limit, now):
+    """Query for the IDs of cards due for review, oldest due first (range scan on ix_card_state_user_due)."""
+    return db.session.query(CardState.question_id).filter(
+        CardState.user_id == user_id, CardState.test_id == test_id, CardState.due_at <= now
+    ).order_by(CardState.due_at).limit(limit)
+
+def due_question_ids(user_id, test_id, limit, now=None):
+    """IDs of cards due for review, oldest due first."""
+    return [row[0] for row in due_cards_query(user_id, test_id, limit, now or datetime.utcnow()).all()]
+
+def new_cards_query(user_id, test_id, limit):
+    """Query for the IDs of cards in a test the user has never reviewed, in question order."""
+    reviewed = db.session.query(CardState.question_id).filter(
+        CardState.user_id == user_id, CardState.question_id == Question.id
+    ).exists()
+    return db.session.query(Question.id).filter(Question.test_id == test_id, ~reviewed).order_by(Question.id).limit(limit)
+
+def new_question_ids(user_id, test_id, limit):
+    """IDs of cards in a test the user has never reviewed, in question order."""
+    return [row[0] for row in new_cards_query(user_id, test_id, limit).all()]
+
+def due_counts_query(user_id, now):
+    """Query for the number of due cards per test for a user."""
+    return db.session.query(CardState.test_id, db.func.count()).filter(
+        CardState.user_id == user_id, CardState.due_at <= now
+    ).group_by(CardState.test_id)
+
+def due_counts(user_id, now=None):
+    """Number of due cards per test for a user, as {test_id: count}."""
+    return dict(due_counts_query(user_id, now or datetime.utcnow()).all())
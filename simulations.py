@@ -0,0 +1,58 @@
+from extensions import db
+from models import SimSession, SimAnswer
+import secrets
+import time
+import json
+
+def start_simulation(user_id, test_id, question_ids, time_limit):
+    """Create a server-side simulation, replacing any the user already has in progress."""
+    for sim in SimSession.query.filter_by(user_id=user_id).all():
+        end_simulation(sim, commit=False)
+    sim = SimSession(
+        token=secrets.token_urlsafe(32),
+        user_id=user_id,
+        test_id=test_id,
+        current=0,
+        start_time=time.time(),
+        time_limit=time_limit,
+        questions=json.dumps(question_ids)
+    )
+    db.session.add(sim)
+    db.session.commit()
+    return sim
+
+def simulation_query(token, user_id):
+    """Query for a simulation by its cookie token, scoped to the owning user."""
+    return SimSession.query.filter_by(token=token, user_id=user_id)
+
+def get_simulation(token, user_id):
+    """Look up a simulation by its cookie token, scoped to the owning user."""
+    if not token:
+        return None
+    return simulation_query(token, user_id).first()
+
+def sim_question_ids(sim):
+    return json.loads(sim.questions or '[]')
+
+def save_sim_answer(sim, question_id, answer):
+    """Write a single answer, leaving the rest of the simulation untouched."""
+    db.session.merge(SimAnswer(sim_session_id=sim.id, question_id=question_id, answer=json.dumps(answer)))
+
+def get_sim_answer(sim, question_id, default=None):
+    row = db.session.get(SimAnswer, (sim.id, question_id))
+    return json.loads(row.answer) if row and row.answer else default
+
+def sim_answers_query(sim_id):
+    """Query for the (question ID, answer JSON) rows of a simulation."""
+    return db.session.query(SimAnswer.question_id, SimAnswer.answer).filter_by(sim_session_id=sim_id)
+
+def get_sim_answers(sim):
+    """All answers of a simulation keyed by question ID string, as stored in History."""
+    rows = sim_answers_query(sim.id).all()
+    return {str(question_id): json.loads(answer) for question_id, answer in rows if answer}
+
+def end_simulation(sim, commit=True):
+    SimAnswer.query.filter_by(sim_session_id=sim.id).delete()
+    db.session.delete(sim)
+    if commit:
+        db.session.commit()
@@ -0,0 +1,14 @@
+import os
+import shutil
+import sys
+import tempfile
+
+# The app reads its configuration when config.py is imported, so the scratch
+# data directory has to be in place before any test module imports the app
+_data_dir = tempfile.mkdtemp(prefix='studbud-tests-')
+os.environ['DATA_DIR'] = _data_dir
+os.environ['IMAGE_BACKGROUND'] = 'false'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_data_dir, ignore_errors=True)
@@ -0,0 +1,79 @@
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from flask_migrate import upgrade
+
+from app import app
+from extensions import db
+from importer import import_tests
+from item_stats import backfill_item_stats
+from models import User, Question, History, SimSession, SimAnswer, CardState
+from query_plans import find_full_scans
+
+# Roughly a busy deployment: a few dozen banks, hundreds of users and a year of attempts
+TESTS = 40
+USERS = 500
+ATTEMPTS = 200000
+SIMULATIONS = 200
+
+BANK = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cisco-svpn-300-730.json')
+
+@pytest.fixture(scope='module')
+def seeded_app():
+    """The app on a migrated scratch database filled at production scale."""
+    rnd = random.Random(1)
+    now = datetime.utcnow()
+    with app.app_context():
+        upgrade()
+        with open(BANK) as f:
+            bank = json.load(f)[0]
+        import_tests([dict(bank, test_name=f'Bank {n}') for n in range(TESTS)])
+        db.session.execute(db.insert(User), [
+            {'username': f'user{n}', 'password_hash': 'x', 'role': 'user'} for n in range(USERS)
+        ])
+        user_ids = db.session.scalars(db.select(User.id)).all()
+        questions = db.session.execute(db.select(Question.id, Question.test_id, Question.correct)).all()
+
+        attempts = []
+        cards = {}
+        for n in range(ATTEMPTS):
+            q_id, test_id, correct = rnd.choice(questions)
+            user_id = rnd.choice(user_ids)
+            answer = correct if rnd.random() < 0.7 else 'Z'
+            attempts.append({'user_id': user_id, 'test_id': test_id, 'mode': 'study', 'score': float(answer == correct),
+                             'date': now - timedelta(minutes=n), 'answers': json.dumps({str(q_id): {str(q_id): answer}})})
+            cards[(user_id, q_id)] = {'user_id': user_id, 'question_id': q_id, 'test_id': test_id, 'easiness': 2.5,
+                                      'interval': 1, 'repetitions': 1, 'last_reviewed': now,
+                                      'due_at': now + timedelta(hours=rnd.randint(-240, 240))}
+        db.session.execute(db.insert(History), attempts)
+        db.session.execute(db.insert(CardState), list(cards.values()))
+
+        for n in range(SIMULATIONS):
+            test_id = rnd.randint(1, TESTS)
+            selected = [q_id for q_id, q_test_id, _ in questions if q_test_id == test_id][:60]
+            sim = SimSession(token=f'token{n}', user_id=rnd.choice(user_ids), test_id=test_id,
+                             start_time=0, questions=json.dumps(selected))
+            db.session.add(sim)
+            db.session.flush()
+            db.session.execute(db.insert(SimAnswer), [
+                {'sim_session_id': sim.id, 'question_id': q_id, 'answer': json.dumps('A')} for q_id in selected
+            ])
+        db.session.commit()
+
+        for test_id in db.session.scalars(db.select(Question.test_id).distinct()).all():
+            backfill_item_stats(test_id)
+        yield app
+        db.session.remove()
+
+@pytest.mark.parametrize('analyzed', [False, True], ids=['without-stats', 'after-analyze'])
+def test_hot_queries_avoid_full_scans(seeded_app, analyzed):
+    with seeded_app.app_context():
+        if analyzed:
+            db.session.execute(db.text('ANALYZE'))
+            db.session.commit()
+        failures = [f'{name}: {"; ".join(scans)} (plan: {" | ".join(plan)})'
+                    for name, plan, scans in find_full_scans() if scans]
+    assert not failures, '\n'.join(failures)
@@ -1,9 +1,17 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, current_app
+from markupsafe import Markup
 from flask_login import login_required, current_user
 from models import Test, Question, History
 from forms import SimStartForm
-from extensions import db
-from utils import calculate_score
+from extensions import db, history_writer
+from utils import calculate_score, question_counts
+from grading import get_answer_key, grade_answer
+from cache import LRUCache
+from review import build_reviews
+from item_stats import item_deltas, record_attempt
+from scheduler import QUALITY_GOOD, preview_review, due_question_ids, new_question_ids, due_counts
+from simulations import start_simulation, get_simulation, sim_question_ids, save_sim_answer, get_sim_answer, get_sim_answers, end_simulation
+from datetime import datetime
 import time
 import random
 import json
@@ -15,12 +23,128 @@ logger = logging.getLogger(__name__)
 
 user_bp = Blueprint('user', __name__)
 
+# Rendered question chunks keyed by (test_id, revision, mode, after); weight is HTML length
+_question_fragments = LRUCache(maxsize=32, maxweight=32 * 1024 * 1024, weigher=lambda fragment: len(fragment[0]))
+
+@user_bp.record_once
+def _init_fragment_cache(state):
+    """Size the question fragment cache from the app config when the blueprint is registered."""
+    config = state.app.config
+    _question_fragments.maxsize = config.get('FRAGMENT_CACHE_SIZE', _question_fragments.maxsize)
+    _question_fragments.maxweight = config.get('FRAGMENT_CACHE_MAX_BYTES', _question_fragments.maxweight)
+
+def _get_test_question(test_id, question_id):
+    """Fetch a single question of a test by primary key."""
+    question = db.session.get(Question, question_id)
+    return question if question is not None and question.test_id == test_id else None
+
+def test_catalogue_query():
+    """Query for every test, as listed on the dashboard."""
+    return Test.query
+
+def question_chunk_query(test_id, after, limit):
+    """Query for up to limit questions of a test with IDs above after, in ID order."""
+    return Question.query.filter(Question.test_id == test_id, Question.id > after).order_by(Question.id).limit(limit)
+
+def question_count_query(test_id, through=None):
+    """Statement counting a test's questions, only those with IDs up to through when given."""
+    statement = db.select(db.func.count(Question.id)).where(Question.test_id == test_id)
+    return statement.where(Question.id <= through) if through is not None else statement
+
+def question_ids_query(test_id):
+    """Query for the IDs of every question in a test."""
+    return db.session.query(Question.id).filter_by(test_id=test_id)
+
+def _score_simulation(test, question_ids, answers, elapsed=None):
+    """Grade a simulation's selected questions against the cached answer key and record item statistics."""
+    item_scores = {}
+    score = calculate_score(question_ids, answers, get_answer_key(test.id, test.revision), item_scores=item_scores)
+    record_attempt(test.id, item_scores, exam=True, elapsed=elapsed)
+    return score
+
+def _prepare_study_questions(questions):
+    """Parse options and mappings onto each question for the study template.
+
+    Returns:
+        list: Warnings for questions whose invalid mappings were filtered out
+    """
+    warnings = []
+    for q in questions:
+        if q.type == 'match':
+            options = json.loads(q.options or '{}')
+            q.parsed_terms = options.get('terms', [])
+            q.parsed_definitions = options.get('definitions', [])
+            q.parsed_mappings = json.loads(q.correct or '{}')
+            # Validate mappings
+            valid_def_ids = {str(definition['id']) for definition in q.parsed_definitions}
+            original_mappings = q.parsed_mappings.copy()
+            q.parsed_mappings = {k: v for k, v in q.parsed_mappings.items() if k in valid_def_ids and v in valid_def_ids}
+            if len(q.parsed_mappings) < len(original_mappings):
+                warnings.append(f'Warning: Some mappings for question ID {q.id} were invalid and filtered out.')
+                logger.debug(f'Question ID {q.id}: Original mappings {original_mappings}, Valid mappings {q.parsed_mappings}, Terms {q.parsed_terms}, Definitions {q.parsed_definitions}')
+        else:
+            q.parsed_options = json.loads(q.options or '[]')
+    return warnings
+
+def _prepare_flashcard_questions(questions):
+    """Parse options and mappings onto each question for the flashcard template."""
+    for q in questions:
+        if q.type == 'match':
+            options = json.loads(q.options or '{}')
+            q.parsed_terms = options.get('terms', [])
+            q.parsed_definitions = options.get('definitions', [])
+            q.parsed_mappings = json.loads(q.correct or '{}')
+        else:
+            q.parsed_options = json.loads(q.options or '[]')
+
+def _render_question_chunk(test, mode, after=0, limit=None):
+    """Render one keyset page of a study or flashcard question list.
+
+    Pages are ordered by Question.id and start after the given ID. The output
+    is identical for every user until an admin changes the test, so the
+    chunks the server itself hands out (QUESTION_CHUNK_SIZE questions,
+    starting at the beginning or at a next_after it returned) are cached per
+    (test_id, revision, mode, after) and only the page chrome is rendered
+    per request. Any other after/limit is rendered without caching, so
+    clients cannot fill the cache with keys of their choosing.
+
+    Returns:
+        tuple: (chunk HTML, number of questions in the chunk, ID to pass as
+            `after` for the next chunk or None when this is the last one,
+            warnings about the chunk's questions for the caller to show)
+    """
+    chunk_size = current_app.config.get('QUESTION_CHUNK_SIZE', 50)
+    if limit is None:
+        limit = chunk_size
+    key = (test.id, test.revision, mode, after)
+    cacheable = limit == chunk_size
+    fragment = _question_fragments.get(key) if cacheable else None
+    if fragment is None:
+        # Questions before this chunk; numbers flashcards and tells server-issued boundaries apart
+        position = db.session.scalar(question_count_query(test.id, through=after)) if after else 0
+        if cacheable and after:
+            cacheable = position % chunk_size == 0 and _get_test_question(test.id, after) is not None
+        questions = question_chunk_query(test.id, after, limit + 1).all()
+        next_after = questions[limit - 1].id if len(questions) > limit else None
+        questions = questions[:limit]
+        warnings = ()
+        if mode == 'study':
+            warnings = tuple(_prepare_study_questions(questions))
+            html = render_template('user/_study_questions.html', questions=questions, mode=mode)
+        else:
+            _prepare_flashcard_questions(questions)
+            html = render_template('user/_flashcard_cards.html', questions=questions, mode=mode, offset=position)
+        fragment = (Markup(html), len(questions), next_after, warnings)
+        if cacheable:
+            _question_fragments.set(key, fragment)
+    return fragment
+
 @user_bp.route('/dashboard')
 @login_required
 def dashboard():
-    tests = Test.query.all()
+    tests = test_catalogue_query().all()
     sim_form = SimStartForm()
-    return render_template('user/dashboard.html', tests=tests, sim_form=sim_form)
+    return render_template('user/dashboard.html', tests=tests, sim_form=sim_form, question_counts=question_counts(), due_counts=due_counts(current_user.id))
 
 @user_bp.route('/quiz/<int:test_id>/<string:mode>', methods=['GET', 'POST'])
 @login_required
@@ -29,8 +153,6 @@ def quiz(test_id, mode):
         flash('Invalid mode.', 'danger')
         return redirect(url_for('user.dashboard'))
     test = Test.query.get_or_404(test_id)
-    questions = Question.query.filter_by(test_id=test_id).all()
-    total_questions = len(questions)
 
     if mode == 'study':
         if request.method == 'POST':
@@ -40,51 +162,28 @@ def quiz(test_id, mode):
                 question_id = data.get('question_id')
                 score = 0
                 if question_id:
-                    question = next((q for q in questions if q.id == int(question_id)), None)
-                    if question:
-                        if question.type == 'match':
-                            correct_mappings = json.loads(question.correct or '{}')
-                            score = sum(1 for term_id, def_id in answers.items()
-                                        if correct_mappings.get(term_id) == def_id) / len(correct_mappings) if correct_mappings else 0.0
+                    compiled = get_answer_key(test_id, test.revision).get(int(question_id))
+                    if compiled:
+                        if compiled.type == 'match':
+                            score = grade_answer(compiled, answers)
                         else:
-                            user_ans = answers.get(str(question.id))
-                            if question.type == 'mrq':
-                                correct = question.correct.split(', ') if question.correct else []
-                                user_ans = user_ans if isinstance(user_ans, list) else []
-                                score = 1 if sorted(correct) == sorted(user_ans) else 0
-                            elif question.type == 'tf':
-                                score = 1 if str(user_ans).lower() == str(question.correct).lower() else 0
-                            else:
-                                score = 1 if user_ans == question.correct else 0
-                        history = History(
+                            score = grade_answer(compiled, answers.get(str(question_id)))
+                        history_writer.add(
                             user_id=current_user.id,
                             test_id=test_id,
                             mode=mode,
                             score=score,
-                            answers=json.dumps({str(question_id): answers})
+                            answers=json.dumps({str(question_id): answers}),
+                            stats=item_deltas(test_id, {int(question_id): score})
                         )
-                        db.session.add(history)
-                        db.session.commit()
-                        return jsonify({'status': 'saved', 'score': score, 'correct': json.loads(question.correct) if question.type == 'match' else question.correct})
+                        return jsonify({'status': 'saved', 'score': score, 'correct': compiled.correct})
                 return jsonify({'status': 'error', 'message': 'Invalid question ID'}), 400
             except Exception as e:
                 return jsonify({'status': 'error', 'message': str(e)}), 400
-        for q in questions:
-            if q.type == 'match':
-                options = json.loads(q.options or '{}')
-                q.parsed_terms = options.get('terms', [])
-                q.parsed_definitions = options.get('definitions', [])
-                q.parsed_mappings = json.loads(q.correct or '{}')
-                # Validate mappings
-                valid_def_ids = {str(definition['id']) for definition in q.parsed_definitions}
-                original_mappings = q.parsed_mappings.copy()
-                q.parsed_mappings = {k: v for k, v in q.parsed_mappings.items() if k in valid_def_ids and v in valid_def_ids}
-                if len(q.parsed_mappings) < len(original_mappings):
-                    flash(f'Warning: Some mappings for question ID {q.id} were invalid and filtered out.', 'warning')
-                    logger.debug(f'Question ID {q.id}: Original mappings {original_mappings}, Valid mappings {q.parsed_mappings}, Terms {q.parsed_terms}, Definitions {q.parsed_definitions}')
-            else:
-                q.parsed_options = json.loads(q.options or '[]')
-        return render_template('user/study_mode.html', test=test, questions=questions, mode=mode)
+        questions_html, _, next_after, warnings = _render_question_chunk(test, mode)
+        for warning in warnings:
+            flash(warning, 'warning')
+        return render_template('user/study_mode.html', test=test, questions_html=questions_html, next_after=next_after, mode=mode)
     
     # Flashcard mode
     if mode == 'flashcard':
@@ -93,112 +192,119 @@ def quiz(test_id, mode):
                 data = request.json
                 score = data.get('score', 0)
                 question_id = data.get('question_id')
+                quality = min(max(int(data.get('quality', QUALITY_GOOD)), 0), 5)
                 
-                if question_id:
-                    history = History(
+                if question_id and int(question_id) in get_answer_key(test_id, test.revision):
+                    # The card is rescheduled with the History row, in the writer's next group commit
+                    reviewed_at = datetime.utcnow()
+                    interval, due_at = preview_review(current_user.id, int(question_id), quality, now=reviewed_at)
+                    history_writer.add(
+                        date=reviewed_at,
                         user_id=current_user.id,
                         test_id=test_id,
                         mode=mode,
                         score=score,
-                        answers=json.dumps({str(question_id): 'reviewed'})
+                        answers=json.dumps({str(question_id): 'reviewed'}),
+                        review=(current_user.id, test_id, int(question_id), quality)
                     )
-                    db.session.add(history)
-                    db.session.commit()
-                    return jsonify({'status': 'saved'})
+                    return jsonify({'status': 'saved', 'interval': interval, 'due_at': due_at.isoformat()})
                 return jsonify({'status': 'error', 'message': 'Invalid question ID'}), 400
             except Exception as e:
+                db.session.rollback()
                 return jsonify({'status': 'error', 'message': str(e)}), 400
-        
-        # Prepare questions for flashcard mode
-        for q in questions:
-            if q.type == 'match':
-                options = json.loads(q.options or '{}')
-                q.parsed_terms = options.get('terms', [])
-                q.parsed_definitions = options.get('definitions', [])
-                q.parsed_mappings = json.loads(q.correct or '{}')
-            else:
-                q.parsed_options = json.loads(q.options or '[]')
-        return render_template('user/flashcard_mode.html', test=test, questions=questions, mode=mode)
+
+        if request.args.get('due'):
+            # Review session: cards due today plus a few never-seen ones
+            question_ids = due_question_ids(current_user.id, test_id, current_app.config.get('FLASHCARD_SESSION_LIMIT', 100))
+            question_ids += new_question_ids(current_user.id, test_id, current_app.config.get('FLASHCARD_NEW_CARDS', 20))
+            by_id = {q.id: q for q in Question.query.filter(Question.id.in_(question_ids)).all()} if question_ids else {}
+            questions = [by_id[q_id] for q_id in question_ids if q_id in by_id]
+            _prepare_flashcard_questions(questions)
+            questions_html = Markup(render_template('user/_flashcard_cards.html', questions=questions, mode=mode, offset=0))
+            return render_template('user/flashcard_mode.html', test=test, questions_html=questions_html, question_count=len(questions), next_after=None, mode=mode, due_session=True)
+
+        questions_html, _, next_after, _ = _render_question_chunk(test, mode)
+        question_count = db.session.scalar(question_count_query(test_id))
+        return render_template('user/flashcard_mode.html', test=test, questions_html=questions_html, question_count=question_count, next_after=next_after, mode=mode)
 
     # Simulation mode configuration from dashboard
-    config_phase = 'sim_progress' not in session or session['sim_progress'].get('test_id') != test_id
+    sim = get_simulation(session.get('sim_token'), current_user.id)
+    config_phase = sim is None or sim.test_id != test_id
     if config_phase:
         form = SimStartForm()
+        question_ids = [row[0] for row in question_ids_query(test_id).all()]
+        total_questions = len(question_ids)
         if request.method == 'POST' and form.validate_on_submit():
             custom_time = form.custom_time.data or 0
             num_questions = int(request.form.get('num_questions', total_questions))
             if 1 <= num_questions <= total_questions:
-                selected_questions = random.sample(questions, num_questions)
+                selected_questions = random.sample(question_ids, num_questions)
                 effective_time_limit = custom_time * 60
-                session['sim_progress'] = {
-                    'test_id': test_id,
-                    'current': 0,
-                    'answers': {},
-                    'start_time': time.time(),
-                    'time_limit': effective_time_limit,
-                    'questions': [q.id for q in selected_questions]
-                }
+                sim = start_simulation(current_user.id, test_id, selected_questions, effective_time_limit)
+                session['sim_token'] = sim.token
                 return redirect(url_for('user.quiz', test_id=test_id, mode='sim'))
             else:
                 flash('Number of questions must be between 1 and the total available.', 'danger')
         return render_template('user/simulation_mode.html', test=test, form=form, total_questions=total_questions, config_phase=config_phase, test_id=test_id)
     else:
-        progress = session.get('sim_progress', {'answers': {}})
-        if not progress or progress.get('test_id') != test_id:
-            flash('Simulation session invalid or stopped. Please start a new simulation.', 'danger')
-            return redirect(url_for('user.dashboard'))
-        time_limit = progress.get('time_limit', 0)
-        start_time = progress.get('start_time', time.time())
+        question_ids = sim_question_ids(sim)
+        time_limit = sim.time_limit or 0
+        start_time = sim.start_time or time.time()
         elapsed = time.time() - start_time
         remaining_seconds = max(0, time_limit - elapsed) if time_limit > 0 else None
 
         if time_limit > 0 and elapsed > time_limit:
-            score = calculate_score([q for q in questions if q.id in progress.get('questions', [])], progress.get('answers', {}))
+            answers = get_sim_answers(sim)
+            score = _score_simulation(test, question_ids, answers, elapsed)
             history = History(
                 user_id=current_user.id,
                 test_id=test_id,
                 mode=mode,
                 score=score,
-                answers=json.dumps(progress.get('answers', {}))
+                answers=json.dumps(answers)
             )
             db.session.add(history)
-            db.session.commit()
-            session.pop('sim_progress', None)
+            end_simulation(sim)
+            session.pop('sim_token', None)
             flash('Time up! Test submitted.', 'info')
-            return render_template('user/results.html', score=score, total=len(progress.get('questions', [])), elapsed=elapsed, test=test)
+            items = build_reviews([history], {test.id: test.revision})[history.id]
+            return render_template('user/results.html', score=score, total=len(question_ids), elapsed=elapsed, test=test, items=items)
 
         if request.method == 'POST' and 'question_id' in request.form:
             q_id = request.form.get('question_id')
             if q_id:
-                question = next((q for q in questions if q.id == int(q_id)), None)
+                question = _get_test_question(test_id, int(q_id))
                 if question:
                     if question.type == 'match':
                         answer = {key: value for key, value in request.form.items() if key.startswith('term_')}
                         answer = {k.replace('term_', ''): v for k, v in answer.items() if v}
                     else:
                         answer = request.form.getlist('correct') if question.type == 'mrq' else request.form.get('correct')
-                    progress.setdefault('answers', {})[q_id] = answer
+                    save_sim_answer(sim, question.id, answer)
 
-            if 'next' in request.form and progress.get('current', 0) < len(progress.get('questions', [])) - 1:
-                progress['current'] = progress.get('current', 0) + 1
-            elif 'prev' in request.form and progress.get('current', 0) > 0:
-                progress['current'] = progress.get('current', 0) - 1
+            if 'next' in request.form and sim.current < len(question_ids) - 1:
+                sim.current += 1
+            elif 'prev' in request.form and sim.current > 0:
+                sim.current -= 1
             elif 'submit' in request.form or (time_limit > 0 and elapsed > time_limit):
-                score = calculate_score([q for q in questions if q.id in progress.get('questions', [])], progress.get('answers', {}))
+                db.session.flush()
+                answers = get_sim_answers(sim)
+                score = _score_simulation(test, question_ids, answers, elapsed)
                 history = History(
                     user_id=current_user.id,
                     test_id=test_id,
                     mode=mode,
                     score=score,
-                    answers=json.dumps(progress.get('answers', {}))
+                    answers=json.dumps(answers)
                 )
                 db.session.add(history)
-                db.session.commit()
-                session.pop('sim_progress', None)
-                return render_template('user/results.html', score=score, total=len(progress.get('questions', [])), elapsed=elapsed, test=test)
-            session['sim_progress'] = progress
+                end_simulation(sim)
+                session.pop('sim_token', None)
+                items = build_reviews([history], {test.id: test.revision})[history.id]
+                return render_template('user/results.html', score=score, total=len(question_ids), elapsed=elapsed, test=test, items=items)
+            db.session.commit()
 
-        current_question = next((q for q in questions if q.id == progress.get('questions', [0])[progress.get('current', 0)]), None)
+        current_question = _get_test_question(test_id, question_ids[sim.current]) if 0 <= sim.current < len(question_ids) else None
         if current_question is None:
             flash('Error: Could not find current question.', 'danger')
             return redirect(url_for('user.dashboard'))
@@ -216,7 +322,7 @@ def quiz(test_id, mode):
                 logger.debug(f'Simulation mode - Question ID {current_question.id}: Original mappings {original_mappings}, Valid mappings {current_question.parsed_mappings}, Terms {current_question.parsed_terms}, Definitions {current_question.parsed_definitions}')
         else:
             current_question.parsed_options = json.loads(current_question.options or '[]')
-        selected = progress.get('answers', {}).get(str(current_question.id), {} if current_question.type == 'match' else [])
+        selected = get_sim_answer(sim, current_question.id, {} if current_question.type == 'match' else [])
 
         return render_template(
             'user/simulation_mode.html',
@@ -224,8 +330,8 @@ def quiz(test_id, mode):
             question=current_question,
             options=current_question.parsed_options if current_question.type != 'match' else current_question.parsed_definitions,
             terms=current_question.parsed_terms if current_question.type == 'match' else [],
-            current=progress.get('current', 0) + 1,
-            total=len(progress.get('questions', [])),
+            current=sim.current + 1,
+            total=len(question_ids),
             time_limit=time_limit,
             start_time=start_time,
             selected=selected,
@@ -233,11 +339,25 @@ def quiz(test_id, mode):
             test_id=test_id
         )
 
+@user_bp.route('/api/test/<int:test_id>/questions')
+@login_required
+def question_chunk(test_id):
+    """Next chunk of a study/flashcard question list, keyset-paginated by question ID."""
+    test = Test.query.get_or_404(test_id)
+    mode = request.args.get('mode', 'study')
+    if mode not in ['study', 'flashcard']:
+        return jsonify({'status': 'error', 'message': 'Invalid mode'}), 400
+    after = request.args.get('after', 0, type=int)
+    limit = min(max(request.args.get('limit', current_app.config.get('QUESTION_CHUNK_SIZE', 50), type=int), 1), 200)
+    html, count, next_after, warnings = _render_question_chunk(test, mode, after, limit)
+    return jsonify({'status': 'ok', 'html': str(html), 'count': count, 'next_after': next_after, 'warnings': list(warnings)})
+
 @user_bp.route('/stop_simulation/<int:test_id>', methods=['POST'])
 @login_required
 def stop_simulation(test_id):
-    if 'sim_progress' in session:
-        session.pop('sim_progress', None)
+    sim = get_simulation(session.pop('sim_token', None), current_user.id)
+    if sim is not None:
+        end_simulation(sim)
         flash('Simulation stopped. Session cleared.', 'success')
     return redirect(url_for('user.dashboard', _external=True))
 
@@ -247,8 +367,50 @@ def instructions():
     """User instructions page."""
     return render_template('user/instructions.html')
 
+def history_page_query(user_id, cursor, limit):
+    """Query for up to limit attempt summaries of a user, newest first, before a (date, id) cursor when given."""
+    query = History.query.options(
+        db.load_only(History.id, History.test_id, History.mode, History.score, History.date)
+    ).filter(History.user_id == user_id)
+    if cursor:
+        query = query.filter(db.tuple_(History.date, History.id) < cursor)
+    return query.order_by(History.date.desc(), History.id.desc()).limit(limit)
+
+def history_review_query(history_id, user_id):
+    """Query for one attempt, scoped to the user who made it."""
+    return History.query.filter_by(id=history_id, user_id=user_id)
+
+def _history_cursor(history):
+    """Opaque keyset cursor for the page after this History row."""
+    return f'{history.date.isoformat()}_{history.id}'
+
+def _parse_history_cursor(cursor):
+    try:
+        date, history_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(date), int(history_id)
+    except ValueError:
+        return None
+
 @user_bp.route('/history')
 @login_required
 def history():
-    histories = History.query.filter_by(user_id=current_user.id).order_by(History.date.desc()).all()
-    return render_template('user/history.html', histories=histories)
\ No newline at end of file
+    """Attempt summaries, newest first, keyset-paginated over (date, id)."""
+    page_size = current_app.config.get('HISTORY_PAGE_SIZE', 25)
+    cursor = _parse_history_cursor(request.args.get('before', ''))
+    histories = history_page_query(current_user.id, cursor, page_size + 1).all()
+    next_cursor = _history_cursor(histories[page_size - 1]) if len(histories) > page_size else None
+    histories = histories[:page_size]
+    test_ids = {h.test_id for h in histories}
+    tests = {t.id: t for t in db.session.query(Test.id, Test.name).filter(Test.id.in_(test_ids)).all()} if test_ids else {}
+    return render_template('user/history.html', histories=histories, tests=tests,
+                           question_counts=question_counts(), next_cursor=next_cursor,
+                           first_page=cursor is None)
+
+@user_bp.route('/api/history/<int:history_id>/review')
+@login_required
+def history_review(history_id):
+    """Review table for one attempt, loaded when its details are expanded."""
+    history = history_review_query(history_id, current_user.id).first_or_404()
+    revision = db.session.query(Test.revision).filter_by(id=history.test_id).scalar()
+    items = build_reviews([history], {history.test_id: revision})[history.id]
+    return jsonify({'status': 'ok', 'html': render_template('user/_review_table.html', items=items)})
\ No newline at end of file
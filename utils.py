@@ -1,140 +1,104 @@
-import json
-import zipfile
 import os
-from io import BytesIO
+import logging
 from flask import current_app
+from werkzeug.utils import secure_filename
+from grading import compile_question, grade_answer
+from image_store import receive_image
+from extensions import db
+from models import Question
+
+logger = logging.getLogger(__name__)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif'}
 
-def calculate_score(questions, user_answers):
+def calculate_score(questions, user_answers, answer_key=None, item_scores=None):
+    """Total score for a set of questions.
+
+    Args:
+        questions: Question objects or question IDs to grade
+        user_answers: Dict mapping question IDs (as strings) to answers
+        answer_key: Compiled answer key from grading.get_answer_key; when omitted,
+            each Question object is compiled on the fly
+        item_scores: Optional dict, filled with question ID -> score
+    """
     score = 0
     for question in questions:
-        user_ans = user_answers.get(str(question.id))
-        if question.type == 'mrq':
-            correct = question.correct.split(', ') if question.correct else []
-            user_ans = user_ans if isinstance(user_ans, list) else []
-            if sorted(correct) == sorted(user_ans):
-                score += 1
-        elif question.type == 'tf':
-            if str(user_ans).lower() == str(question.correct).lower():
-                score += 1
-        elif question.type == 'match':
-            if user_ans and question.correct:
-                correct_mappings = json.loads(question.correct)
-                correct_count = sum(1 for term_id, def_id in user_ans.items()
-                                   if correct_mappings.get(term_id) == def_id)
-                score += correct_count / len(correct_mappings) if correct_mappings else 0.0
-        else:
-            if user_ans == question.correct:
-                score += 1
+        q_id = question if isinstance(question, int) else question.id
+        compiled = answer_key.get(q_id) if answer_key is not None else None
+        if compiled is None:
+            if isinstance(question, int):
+                continue
+            compiled = compile_question(question.type, question.correct)
+        item_score = grade_answer(compiled, user_answers.get(str(q_id)))
+        if item_scores is not None:
+            item_scores[q_id] = item_score
+        score += item_score
     return score
 
+def normalize_image_path(image_path):
+    """Normalize image path by removing 'uploads/' prefix if present."""
+    if image_path and image_path.startswith('uploads/'):
+        return os.path.basename(image_path)
+    return image_path
+
+def question_counts_query():
+    """Query for the number of questions per test ID, grouped in one pass."""
+    return db.session.query(Question.test_id, db.func.count(Question.id)).group_by(Question.test_id)
+
+def question_counts():
+    """Number of questions per test ID, from a single grouped query."""
+    return dict(question_counts_query().all())
+
 def allowed_import_file(filename):
     """Check if file is allowed for import (JSON or ZIP)"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'json', 'zip'}
 
-def create_test_zip(test_data, images_data):
-    """Create a ZIP archive containing test data and images
-    
-    Args:
-        test_data: List of test dictionaries (JSON serializable)
-        images_data: Dictionary mapping image filenames to file paths
-    
-    Returns:
-        BytesIO object containing the ZIP archive
-    """
-    zip_buffer = BytesIO()
-    
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        # Add test data as JSON
-        test_json = json.dumps(test_data, indent=4, ensure_ascii=False)
-        zip_file.writestr('test_data.json', test_json)
-        
-        # Add images
-        upload_folder = current_app.config['UPLOAD_FOLDER']
-        for image_filename, image_path in images_data.items():
-            if image_filename and os.path.exists(image_path):
-                # Add to images/ folder in ZIP
-                zip_path = f'images/{image_filename}'
-                zip_file.write(image_path, zip_path)
-    
-    zip_buffer.seek(0)
-    return zip_buffer
+def extract_zip_images(zip_ref, upload_folder=None):
+    """Stream the images of an open ZIP bank to temporary files
 
-def extract_test_zip(zip_file):
-    """Extract test data and images from ZIP file
-    
-    Args:
-        zip_file: File-like object containing ZIP archive
-    
-    Returns:
-        tuple: (test_data_json, extracted_images_dict)
-            test_data_json: Parsed JSON data
-            extracted_images_dict: Dict mapping filenames to BytesIO objects
-    """
-    test_data = None
-    extracted_images = {}
-    
-    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-        # Validate ZIP structure
-        file_list = zip_ref.namelist()
-        
-        if 'test_data.json' not in file_list:
-            raise ValueError("ZIP file must contain 'test_data.json'")
-        
-        # Extract test data
-        with zip_ref.open('test_data.json') as json_file:
-            test_data = json.load(json_file)
-        
-        # Extract images
-        for filename in file_list:
-            if filename.startswith('images/') and not filename.endswith('/'):
-                image_filename = filename.replace('images/', '')
-                
-                # Validate image file extension
-                if allowed_file(image_filename):
-                    with zip_ref.open(filename) as img_file:
-                        extracted_images[image_filename] = BytesIO(img_file.read())
-    
-    return test_data, extracted_images
+    Images are copied member by member straight to disk and hashed on the
+    way, so memory use does not depend on their size or number. The
+    returned pairs are ready for image_store.store_images, which keeps one
+    copy per distinct image. The bank's test_data.json is left in the
+    archive for the caller to stream.
 
-def save_extracted_images(extracted_images):
-    """Save extracted images to the uploads folder
-    
     Args:
-        extracted_images: Dict mapping filenames to BytesIO objects
-    
+        zip_ref: Open zipfile.ZipFile
+        upload_folder: Destination folder, defaults to UPLOAD_FOLDER
+
     Returns:
-        list: List of successfully saved image filenames
+        tuple: (received_images, errors)
+            received_images: Dict mapping image names in the archive to (temporary path, digest)
+            errors: Dict mapping image names to error messages
     """
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    saved_images = []
-    
-    # Ensure upload folder exists
-    os.makedirs(upload_folder, exist_ok=True)
-    
-    for filename, image_data in extracted_images.items():
-        try:
-            file_path = os.path.join(upload_folder, filename)
-            
-            # Handle filename conflicts by adding a number
-            original_filename = filename
-            counter = 1
-            while os.path.exists(file_path):
-                name, ext = os.path.splitext(original_filename)
-                filename = f"{name}_{counter}{ext}"
-                file_path = os.path.join(upload_folder, filename)
-                counter += 1
-            
-            # Save the image
-            with open(file_path, 'wb') as f:
-                f.write(image_data.getvalue())
-            
-            saved_images.append(filename)
-            
-        except Exception as e:
-            print(f"Error saving image {filename}: {str(e)}")
-            continue
-    
-    return saved_images
\ No newline at end of file
+    upload_folder = upload_folder or current_app.config['UPLOAD_FOLDER']
+    received_images = {}
+    errors = {}
+
+    # Validate ZIP structure
+    if 'test_data.json' not in zip_ref.namelist():
+        raise ValueError("ZIP file must contain 'test_data.json'")
+
+    try:
+        for member in zip_ref.infolist():
+            if not member.filename.startswith('images/') or member.is_dir():
+                continue
+            image_name = os.path.basename(member.filename)
+            if not allowed_file(image_name):
+                continue
+            if not allowed_file(secure_filename(image_name)):
+                errors[image_name] = 'invalid file name'
+                continue
+            try:
+                with zip_ref.open(member) as src:
+                    received_images[image_name] = receive_image(src, image_name, upload_folder)
+            except Exception as e:
+                errors[image_name] = str(e)
+                logger.error(f'Error extracting image {member.filename}: {str(e)}')
+    except BaseException:
+        for tmp_path, _ in received_images.values():
+            os.remove(tmp_path)
+        raise
+
+    return received_images, errors
\ No newline at end of file